@@ -0,0 +1,87 @@
+"""
+Decoding time and peak memory of a large LISTSTATUS response:
+
+* json: the whole response decoded to dicts, then converted to FileStat
+* streaming: FileStat records built by the JSON decoder's object hook
+* orjson: decoded by orjson, then converted to FileStat (if installed)
+
+    python -m benchmarks.json_decode [--entries 200000] [--response FILE]
+
+--response takes a recorded LISTSTATUS response instead of a synthetic one.
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+import webhdfs
+from benchmarks.stat_memory import synthetic_listing
+from pywebhdfs import webhdfs as pywebhdfs_webhdfs
+
+
+class RecordedResponse(object):
+    def __init__(self, content):
+        self.content = content
+
+
+def decode_json(response):
+    body = json.loads(response.content)
+    return [webhdfs.webhdfs_entry_to_named_stat(s)
+            for s in body["FileStatuses"]["FileStatus"]]
+
+
+def decode_streaming(response):
+    orjson, pywebhdfs_webhdfs.orjson = pywebhdfs_webhdfs.orjson, None
+    try:
+        return pywebhdfs_webhdfs._decode_json(
+            response, webhdfs.webhdfs_entry_to_named_stat
+        )["FileStatuses"]["FileStatus"]
+    finally:
+        pywebhdfs_webhdfs.orjson = orjson
+
+
+def decode_orjson(response):
+    return pywebhdfs_webhdfs._decode_json(
+        response, webhdfs.webhdfs_entry_to_named_stat
+    )["FileStatuses"]["FileStatus"]
+
+
+def measure(name, response, decode):
+    started = time.perf_counter()
+    entries = decode(response)
+    elapsed = time.perf_counter() - started
+    del entries
+    # Measured separately, tracemalloc slows decoding down considerably
+    tracemalloc.start()
+    entries = decode(response)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("{:10} {:>8} entries {:>8.2f} s {:>10.1f} MB peak".format(
+        name, len(entries), elapsed, peak / 2**20))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--entries', type=int, default=200000)
+    parser.add_argument('--response', help='Recorded LISTSTATUS response')
+    args = parser.parse_args()
+
+    if args.response:
+        with open(args.response, 'rb') as f:
+            content = f.read()
+    else:
+        content = json.dumps({"FileStatuses": {
+            "FileStatus": list(synthetic_listing(args.entries))}}).encode()
+    response = RecordedResponse(content)
+    print("Response size {:.1f} MB".format(len(content) / 2**20))
+
+    measure('json', response, decode_json)
+    measure('streaming', response, decode_streaming)
+    if pywebhdfs_webhdfs.orjson is not None:
+        measure('orjson', response, decode_orjson)
+    else:
+        print("orjson is not installed")
+
+
+if __name__ == '__main__':
+    main()
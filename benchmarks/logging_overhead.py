@@ -0,0 +1,116 @@
+"""
+Cost of logging on cached reads and stats, called through the file system
+object the way FUSE calls them, with the logging set up as:
+
+* legacy: fusepy's LoggingMixIn, two INFO messages per read and a
+  synchronous log file at INFO, as before logging was made asynchronous
+* default: warnings only, as without --logfile
+* info: asynchronous log file at INFO, as with --logfile
+* debug: asynchronous log file at DEBUG, logging every operation
+* debug-sync: the same with a synchronous log file
+* debug-sampled: asynchronous, 1% of the debug messages
+
+    python -m benchmarks.logging_overhead [--ops 20000]
+"""
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from fuse import LoggingMixIn
+
+from benchmarks.mock_webhdfs import MockWebHDFS
+from benchmarks.suite import FUSE_READ_SIZE, MB, make_file
+from config.webhdfs import WebHDFSConfig, commandline_parser
+from fuse_webhdfs.asynclog import LOG_FORMAT, AsyncLogWriter
+
+import mount_webhdfs
+
+
+class LegacyWebHDFS(LoggingMixIn, mount_webhdfs.WebHDFS):
+
+    def read(self, path, size, offset, fh):
+        mount_webhdfs.logger.info("read: path %s size %d offset %d", path, size, offset)
+        data = super().read(path, size, offset, fh)
+        mount_webhdfs.logger.info("read: path %s result size %d", path, len(data))
+        return data
+
+
+def reset_logging():
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.setLevel(logging.WARNING)
+
+
+def sync_logging(level, filename):
+    handler = logging.FileHandler(filename)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    logging.getLogger().addHandler(handler)
+    logging.getLogger().setLevel(level)
+
+
+def run(name, cluster, config, args, logfile):
+    reset_logging()
+    log_writer = None
+    fs_class = mount_webhdfs.WebHDFS
+    if name == 'legacy':
+        sync_logging(logging.INFO, logfile)
+        fs_class = LegacyWebHDFS
+    elif name == 'debug-sync':
+        sync_logging(logging.DEBUG, logfile)
+    elif name != 'default':
+        level = 'INFO' if name == 'info' else 'DEBUG'
+        sample_rate = 0.01 if name == 'debug-sampled' else 1
+        log_writer = AsyncLogWriter(level, filename=logfile, sample_rate=sample_rate)
+    fs = fs_class(config, log_writer=log_writer)
+    fs('init', '/')
+    size = args.file_size * MB
+    # Fill the block cache, so that only the file system code is measured
+    for offset in range(0, size, FUSE_READ_SIZE):
+        fs('read', '/data', FUSE_READ_SIZE, offset, 0)
+
+    started = time.perf_counter()
+    offset = 0
+    for _ in range(args.ops):
+        fs('getattr', '/data', None)
+        fs('read', '/data', FUSE_READ_SIZE, offset, 0)
+        offset = (offset + FUSE_READ_SIZE) % size
+    elapsed = time.perf_counter() - started
+    fs('destroy', '/')
+    reset_logging()
+    log_size = os.path.getsize(logfile) if os.path.exists(logfile) else 0
+    print("{:14} {:>8.0f} ops/s {:>8.1f} us/op {:>10.1f} MB logged".format(
+        name, 2 * args.ops / elapsed, elapsed / (2 * args.ops) * 1e6, log_size / MB))
+    if os.path.exists(logfile):
+        os.unlink(logfile)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ops', type=int, default=20000,
+                        help='Number of getattr and read pairs')
+    parser.add_argument('--file-size', type=int, default=16, metavar='<MB>')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='webhdfs-bench-')
+    logfile = os.path.join(tempfile.mkdtemp(prefix='webhdfs-log-'), 'mount.log')
+    try:
+        with MockWebHDFS(root) as cluster:
+            make_file(cluster, '/data', args.file_size * MB)
+            options = commandline_parser().parse_args(['localhost'])
+            options.hdfs_baseurl = cluster.base_uri
+            config = WebHDFSConfig(**options.__dict__)
+            for name in ('legacy', 'default', 'info', 'debug', 'debug-sync',
+                         'debug-sampled'):
+                run(name, cluster, config, args, logfile)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+        shutil.rmtree(os.path.dirname(logfile), ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
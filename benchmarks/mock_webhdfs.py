@@ -0,0 +1,419 @@
+"""
+An in-process mock of a WebHDFS cluster backed by a local directory.
+
+It runs an active namenode, optionally a standby namenode answering every
+request with a StandbyException, and a datanode. Like a real cluster the
+namenode redirects OPEN, CREATE and APPEND to the datanode with a 307.
+Every response can be delayed by a fixed latency and data transfers can be
+throttled to a bandwidth, so the client behaves as it would over a network.
+
+    with MockWebHDFS('/tmp/hdfs-root', latency=0.001) as cluster:
+        client = PyWebHdfsClient(base_uri_pattern=cluster.base_uri)
+"""
+from collections import Counter
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import shutil
+import threading
+import time
+from urllib.parse import parse_qsl, unquote, urlencode, urlsplit
+
+TRANSFER_CHUNK_SIZE = 64 * 1024
+
+
+class MockWebHDFS(object):
+    """
+    :param root: local directory holding the file system contents
+    :param latency: seconds every response is delayed by
+    :param bandwidth: bytes per second data is sent and received with,
+      unlimited if None
+    :param standby: also run a standby namenode, which is listed before
+      the active one in namenode_hosts
+    :param page_size: number of entries of a LISTSTATUS_BATCH page
+    """
+
+    def __init__(self, root, latency=0, bandwidth=None, standby=False,
+                 page_size=1000):
+        self.root = os.path.abspath(root)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.page_size = page_size
+        self.requests = Counter()
+        self._requests_lock = threading.Lock()
+        self._servers = []
+        self.namenode = self._start('namenode')
+        self.datanode = self._start('datanode')
+        self.standby = self._start('standby') if standby else None
+
+    def _start(self, role):
+        server = _Server(('127.0.0.1', 0), _Handler)
+        server.daemon_threads = True
+        server.cluster = self
+        server.role = role
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self._servers.append(server)
+        return server
+
+    @staticmethod
+    def _host(server):
+        return '127.0.0.1:{}'.format(server.server_port)
+
+    @property
+    def namenode_hosts(self):
+        """
+        Hosts of the namenodes, to be used with
+        base_uri_pattern="http://{host}/webhdfs/v1/"
+        """
+        hosts = [self._host(self.namenode)]
+        if self.standby is not None:
+            hosts.insert(0, self._host(self.standby))
+        return hosts
+
+    @property
+    def base_uri(self):
+        return 'http://{}/webhdfs/v1/'.format(self._host(self.namenode))
+
+    def count(self, role, operation):
+        with self._requests_lock:
+            self.requests[(role, operation)] += 1
+
+    def reset_counts(self):
+        with self._requests_lock:
+            self.requests.clear()
+
+    def local_path(self, path):
+        return os.path.join(self.root, path.lstrip('/'))
+
+    def close(self):
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _Server(ThreadingHTTPServer):
+    # Accept bursts of hundreds of concurrent connections like a real
+    # namenode does, instead of resetting them
+    request_queue_size = 1024
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, don't let Nagle's algorithm
+    # and delayed ACKs add 40 ms to every response
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def cluster(self):
+        return self.server.cluster
+
+    def _parse(self):
+        parts = urlsplit(self.path)
+        prefix = '/webhdfs/v1'
+        path = unquote(parts.path[len(prefix):]) or '/'
+        params = dict(parse_qsl(parts.query))
+        return path, params
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def _dispatch(self, method):
+        path, params = self._parse()
+        operation = params.get('op', '').upper()
+        role = self.server.role
+        self.cluster.count(role, operation)
+        if self.cluster.latency:
+            time.sleep(self.cluster.latency)
+        if method in ('PUT', 'POST') and role != 'datanode':
+            # The namenode never reads the data, just like a real one
+            self._discard_body()
+        try:
+            if role == 'standby':
+                return self._send_exception(
+                    HTTPStatus.FORBIDDEN, 'StandbyException',
+                    'Operation category READ is not supported in state standby')
+            if role == 'datanode':
+                return getattr(self, '_dn_' + operation)(path, params)
+            handler = getattr(self, '_nn_' + operation, None)
+            if handler is None:
+                return self._send_exception(
+                    HTTPStatus.BAD_REQUEST, 'IllegalArgumentException',
+                    'Invalid value for webhdfs parameter "op": '
+                    'No enum constant {}'.format(operation))
+            return handler(path, params)
+        except (FileNotFoundError, NotADirectoryError):
+            return self._send_exception(
+                HTTPStatus.NOT_FOUND, 'FileNotFoundException',
+                'File does not exist: {}'.format(path))
+        except FileExistsError:
+            return self._send_exception(
+                HTTPStatus.FORBIDDEN, 'FileAlreadyExistsException',
+                '{} already exists'.format(path))
+
+    # Helpers
+
+    def _send_json(self, body, status=HTTPStatus.OK):
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _send_exception(self, status, exception, message):
+        self._send_json({"RemoteException": {
+            "exception": exception,
+            "javaClassName": "org.apache.hadoop." + exception,
+            "message": message}}, status)
+
+    def _redirect(self, path, params):
+        query = urlencode(dict(params, namenoderpcaddress='mock:8020'))
+        location = 'http://127.0.0.1:{}/webhdfs/v1{}?{}'.format(
+            self.cluster.datanode.server_port, path, query)
+        self.send_response(HTTPStatus.TEMPORARY_REDIRECT)
+        self.send_header('Location', location)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _throttle(self, started, transferred):
+        bandwidth = self.cluster.bandwidth
+        if bandwidth:
+            delay = started + transferred / bandwidth - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def _iter_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            while True:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return
+                chunk = self.rfile.read(size)
+                self.rfile.readline()
+                yield chunk
+        else:
+            remaining = int(self.headers.get('Content-Length') or 0)
+            while remaining:
+                chunk = self.rfile.read(min(remaining, TRANSFER_CHUNK_SIZE))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+
+    def _discard_body(self):
+        for _ in self._iter_body():
+            pass
+
+    def _receive(self, f):
+        started = time.monotonic()
+        received = 0
+        for chunk in self._iter_body():
+            f.write(chunk)
+            received += len(chunk)
+            self._throttle(started, received)
+
+    def _file_status(self, local_path, path_suffix):
+        st = os.stat(local_path)
+        is_dir = os.path.isdir(local_path)
+        return {
+            "accessTime": int(st.st_atime * 1000),
+            "blockSize": 0 if is_dir else 134217728,
+            "childrenNum": len(os.listdir(local_path)) if is_dir else 0,
+            "fileId": st.st_ino,
+            "group": "supergroup",
+            "length": 0 if is_dir else st.st_size,
+            "modificationTime": int(st.st_mtime * 1000),
+            "owner": "hdfs",
+            "pathSuffix": path_suffix,
+            "permission": oct(st.st_mode & 0o777)[2:],
+            "replication": 0 if is_dir else 3,
+            "storagePolicy": 0,
+            "type": "DIRECTORY" if is_dir else "FILE",
+        }
+
+    def _list(self, local_path):
+        if os.path.isdir(local_path):
+            names = sorted(os.listdir(local_path))
+            return [self._file_status(os.path.join(local_path, name), name)
+                    for name in names]
+        return [self._file_status(local_path, '')]
+
+    # Namenode operations
+
+    def _nn_GETFILESTATUS(self, path, params):
+        local_path = self.cluster.local_path(path)
+        self._send_json({"FileStatus": self._file_status(local_path, '')})
+
+    def _nn_LISTSTATUS(self, path, params):
+        local_path = self.cluster.local_path(path)
+        self._send_json({"FileStatuses": {
+            "FileStatus": self._list(local_path)}})
+
+    def _nn_LISTSTATUS_BATCH(self, path, params):
+        local_path = self.cluster.local_path(path)
+        names = sorted(os.listdir(local_path))
+        start = 0
+        if 'startAfter' in params:
+            start = next((i for i, name in enumerate(names)
+                          if name > params['startAfter']), len(names))
+        page = names[start:start + self.cluster.page_size]
+        file_statuses = [
+            self._file_status(os.path.join(local_path, name), name)
+            for name in page]
+        self._send_json({"DirectoryListing": {
+            "partialListing": {"FileStatuses": {"FileStatus": file_statuses}},
+            "remainingEntries": len(names) - start - len(page)}})
+
+    def _nn_GETCONTENTSUMMARY(self, path, params):
+        local_path = self.cluster.local_path(path)
+        os.stat(local_path)
+        directories, files, length = 0, 0, 0
+        for dirpath, dirnames, filenames in os.walk(local_path):
+            directories += 1
+            files += len(filenames)
+            length += sum(os.path.getsize(os.path.join(dirpath, name))
+                          for name in filenames)
+        self._send_json({"ContentSummary": {
+            "directoryCount": directories, "fileCount": files,
+            "length": length, "quota": -1,
+            "spaceConsumed": length * 3, "spaceQuota": -1}})
+
+    def _nn_GETQUOTAUSAGE(self, path, params):
+        local_path = self.cluster.local_path(path)
+        os.stat(local_path)
+        count, length = 0, 0
+        for dirpath, dirnames, filenames in os.walk(local_path):
+            count += 1 + len(filenames)
+            length += sum(os.path.getsize(os.path.join(dirpath, name))
+                          for name in filenames)
+        # Like the root directory of HDFS, which has the maximum namespace
+        # quota and no space quota
+        self._send_json({"QuotaUsage": {
+            "fileAndDirectoryCount": count, "quota": 2 ** 63 - 1,
+            "spaceConsumed": length * 3, "spaceQuota": -1}})
+
+    def _nn_GETSTATUS(self, path, params):
+        usage = shutil.disk_usage(self.cluster.root)
+        self._send_json({"FsStatus": {
+            "capacity": usage.total, "used": usage.used,
+            "remaining": usage.free}})
+
+    def _nn_MKDIRS(self, path, params):
+        local_path = self.cluster.local_path(path)
+        os.makedirs(local_path, exist_ok=True)
+        if 'permission' in params:
+            os.chmod(local_path, int(params['permission'], 8))
+        self._send_json({"boolean": True})
+
+    def _nn_DELETE(self, path, params):
+        local_path = self.cluster.local_path(path)
+        if not os.path.lexists(local_path):
+            return self._send_json({"boolean": False})
+        if os.path.isdir(local_path):
+            if params.get('recursive') == 'true':
+                shutil.rmtree(local_path)
+            else:
+                os.rmdir(local_path)
+        else:
+            os.unlink(local_path)
+        self._send_json({"boolean": True})
+
+    def _nn_RENAME(self, path, params):
+        try:
+            os.rename(self.cluster.local_path(path),
+                      self.cluster.local_path(params['destination']))
+        except OSError:
+            return self._send_json({"boolean": False})
+        self._send_json({"boolean": True})
+
+    def _nn_SETPERMISSION(self, path, params):
+        os.chmod(self.cluster.local_path(path), int(params['permission'], 8))
+        self._send_json({})
+
+    def _nn_SETTIMES(self, path, params):
+        local_path = self.cluster.local_path(path)
+        st = os.stat(local_path)
+        times = [st.st_atime, st.st_mtime]
+        for i, name in enumerate(('accesstime', 'modificationtime')):
+            if int(params.get(name, -1)) >= 0:
+                times[i] = int(params[name]) / 1000
+        os.utime(local_path, tuple(times))
+        self._send_json({})
+
+    def _nn_OPEN(self, path, params):
+        if not os.path.isfile(self.cluster.local_path(path)):
+            raise FileNotFoundError(path)
+        self._redirect(path, params)
+
+    def _nn_CREATE(self, path, params):
+        local_path = self.cluster.local_path(path)
+        if os.path.exists(local_path) and params.get('overwrite') != 'true':
+            raise FileExistsError(path)
+        self._redirect(path, params)
+
+    def _nn_APPEND(self, path, params):
+        if not os.path.isfile(self.cluster.local_path(path)):
+            raise FileNotFoundError(path)
+        self._redirect(path, params)
+
+    # Datanode operations
+
+    def _dn_OPEN(self, path, params):
+        local_path = self.cluster.local_path(path)
+        with open(local_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            offset = min(int(params.get('offset', 0)), size)
+            length = size - offset
+            if 'length' in params:
+                length = min(int(params['length']), length)
+            f.seek(offset)
+            self.send_response(HTTPStatus.OK)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(length))
+            self.end_headers()
+            started = time.monotonic()
+            sent = 0
+            while sent < length:
+                chunk = f.read(min(TRANSFER_CHUNK_SIZE, length - sent))
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                self._throttle(started, sent)
+
+    def _dn_CREATE(self, path, params):
+        local_path = self.cluster.local_path(path)
+        with open(local_path, 'wb') as f:
+            self._receive(f)
+        if 'permission' in params:
+            os.chmod(local_path, int(params['permission'], 8))
+        self.send_response(HTTPStatus.CREATED)
+        self.send_header('Location', 'hdfs://mock:8020' + path)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _dn_APPEND(self, path, params):
+        with open(self.cluster.local_path(path), 'ab') as f:
+            self._receive(f)
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
@@ -0,0 +1,53 @@
+"""
+Memory used by the cached attributes of a synthetic directory listing,
+as dicts (webhdfs_entry_to_dict) versus compact FileStat records.
+
+    python -m benchmarks.stat_memory [--entries 1000000]
+"""
+import argparse
+import time
+import tracemalloc
+
+import webhdfs
+
+
+def synthetic_listing(entries):
+    for i in range(entries):
+        yield {
+            "accessTime": 1371737704282 + i,
+            "blockSize": 134217728,
+            "childrenNum": 0,
+            "group": "hdfs",
+            "length": 90 + i,
+            "modificationTime": 1371737704595 + i,
+            "owner": "hdfs",
+            "pathSuffix": "part-{:08d}.parquet".format(i),
+            "permission": "644",
+            "replication": 3,
+            "type": "FILE",
+        }
+
+
+def measure(name, entries, convert):
+    tracemalloc.start()
+    started = time.perf_counter()
+    cache = [convert(s) for s in synthetic_listing(entries)]
+    elapsed = time.perf_counter() - started
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("{:10} {:>10.1f} MB {:>8.0f} bytes/entry {:>8.2f} s".format(
+        name, size / 2**20, size / entries, elapsed))
+    del cache
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--entries', type=int, default=1000000)
+    args = parser.parse_args()
+
+    measure('dict', args.entries, webhdfs.webhdfs_entry_to_dict)
+    measure('FileStat', args.entries, webhdfs.webhdfs_entry_to_stat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+"""
+End-to-end benchmarks of the file system operations against a local mock
+WebHDFS cluster. The operations are called the way FUSE calls them, so no
+mount (and no root) is needed and everything runs offline.
+
+    python -m benchmarks.suite [--latency 0.002] [--bandwidth 100]
+                               [--only sequential-read,stat-storm]
+
+Every scenario reports operations and bytes per second, the requests the
+cluster received per node and operation, and p50/p99 operation latency.
+Mount options (e.g. --cache-size 0 or --threads) can be passed after --,
+so that their effect can be compared:
+
+    python -m benchmarks.suite -- --cache-size 0
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.mock_webhdfs import MockWebHDFS
+from config.webhdfs import WebHDFSConfig, commandline_parser
+
+import mount_webhdfs
+
+MB = 1024 * 1024
+FUSE_READ_SIZE = 128 * 1024
+FUSE_WRITE_SIZE = 128 * 1024
+
+
+class Result(object):
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.bytes = 0
+        self.elapsed = 0
+        self._started = None
+
+    def start(self, cluster):
+        """
+        Called by the scenarios once their data is set up
+        """
+        cluster.reset_counts()
+        self._started = time.perf_counter()
+
+    def stop(self):
+        self.elapsed = time.perf_counter() - self._started
+
+    def time(self, func, *args):
+        started = time.perf_counter()
+        ret = func(*args)
+        self.latencies.append(time.perf_counter() - started)
+        return ret
+
+    def percentile(self, p):
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return 0
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+    def report(self, requests):
+        ops = len(self.latencies)
+        print("{}: {} ops in {:.2f} s, {:.0f} ops/s, {:.1f} MB/s, "
+              "p50 {:.3f} ms, p99 {:.3f} ms".format(
+                  self.name, ops, self.elapsed, ops / self.elapsed,
+                  self.bytes / MB / self.elapsed,
+                  self.percentile(0.5) * 1000, self.percentile(0.99) * 1000))
+        for (role, operation), count in sorted(requests.items()):
+            print("    {:9} {:18} {:>8}".format(role, operation, count))
+
+
+def make_file(cluster, path, size):
+    with open(cluster.local_path(path), 'wb') as f:
+        chunk = os.urandom(min(size, MB))
+        for offset in range(0, size, len(chunk)):
+            f.write(chunk[:size - offset])
+
+
+def make_tree(cluster, path, depth, fanout, files):
+    os.makedirs(cluster.local_path(path), exist_ok=True)
+    for i in range(files):
+        make_file(cluster, '{}/part-{:05d}'.format(path, i), 1024)
+    if depth:
+        for i in range(fanout):
+            make_tree(cluster, '{}/dir-{:03d}'.format(path, i),
+                      depth - 1, fanout, files)
+
+
+def sequential_read(fs, cluster, args, result):
+    path = '/sequential'
+    size = args.file_size * MB
+    make_file(cluster, path, size)
+    result.start(cluster)
+    for offset in range(0, size, FUSE_READ_SIZE):
+        result.bytes += len(result.time(
+            fs.read, path, FUSE_READ_SIZE, offset, 0))
+
+
+def random_read(fs, cluster, args, result):
+    import random
+    path = '/random'
+    size = args.file_size * MB
+    make_file(cluster, path, size)
+    rnd = random.Random(42)
+    result.start(cluster)
+    for _ in range(args.random_reads):
+        offset = rnd.randrange(0, size - FUSE_READ_SIZE)
+        result.bytes += len(result.time(
+            fs.read, path, FUSE_READ_SIZE, offset, 0))
+
+
+def large_write(fs, cluster, args, result):
+    path = '/written'
+    size = args.file_size * MB
+    chunk = os.urandom(FUSE_WRITE_SIZE)
+    result.start(cluster)
+    result.time(fs.create, path, 0o644)
+    for offset in range(0, size, FUSE_WRITE_SIZE):
+        result.bytes += result.time(fs.write, path, chunk, offset, 0)
+    result.time(fs.flush, path, 0)
+    result.time(fs.release, path, 0)
+
+
+def list_recursive(fs, cluster, args, result):
+    make_tree(cluster, '/tree', args.tree_depth, args.tree_fanout,
+              args.tree_files)
+    result.start(cluster)
+
+    def walk(path):
+        for name in result.time(lambda: list(fs.readdir(path, 0))):
+            if name in ('.', '..'):
+                continue
+            child = path + '/' + name
+            st = result.time(fs.getattr, child)
+            if st['st_mode'] & 0o040000:
+                walk(child)
+    walk('/tree')
+
+
+def stat_storm(fs, cluster, args, result):
+    make_tree(cluster, '/stats', 0, 0, args.stat_files)
+    paths = ['/stats/part-{:05d}'.format(i) for i in range(args.stat_files)]
+    result.start(cluster)
+    for _ in range(args.stat_rounds):
+        for path in paths:
+            result.time(fs.getattr, path)
+
+
+SCENARIOS = [
+    ('sequential-read', sequential_read),
+    ('random-read', random_read),
+    ('large-write', large_write),
+    ('ls-R', list_recursive),
+    ('stat-storm', stat_storm),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='WebHDFS file system benchmarks against a mock cluster')
+    parser.add_argument('--latency', type=float, default=0.001,
+                        help='Seconds every response is delayed by')
+    parser.add_argument('--bandwidth', type=float, default=None,
+                        help='Bandwidth of data transfers in MB/s')
+    parser.add_argument('--standby', action='store_true',
+                        help='Put a standby namenode in front of the active one')
+    parser.add_argument('--only', help='Comma separated scenarios to run')
+    parser.add_argument('--file-size', type=int, default=64, metavar='<MB>')
+    parser.add_argument('--random-reads', type=int, default=500)
+    parser.add_argument('--tree-depth', type=int, default=3)
+    parser.add_argument('--tree-fanout', type=int, default=4)
+    parser.add_argument('--tree-files', type=int, default=20)
+    parser.add_argument('--stat-files', type=int, default=1000)
+    parser.add_argument('--stat-rounds', type=int, default=5)
+    parser.add_argument('mount_options', nargs=argparse.REMAINDER,
+                        help='Mount options to benchmark with, after --')
+    args = parser.parse_args()
+
+    mount_options = [option for option in args.mount_options if option != '--']
+    only = args.only.split(',') if args.only else None
+    for name, scenario in SCENARIOS:
+        if only and name not in only:
+            continue
+        root = tempfile.mkdtemp(prefix='webhdfs-bench-')
+        bandwidth = args.bandwidth * MB if args.bandwidth else None
+        try:
+            with MockWebHDFS(root, latency=args.latency, bandwidth=bandwidth,
+                             standby=args.standby) as cluster:
+                options = commandline_parser().parse_args(
+                    ['localhost'] + mount_options)
+                options.hdfs_baseurl = cluster.base_uri
+                config = WebHDFSConfig(**options.__dict__)
+                fs = mount_webhdfs.WebHDFS(config)
+                if args.standby:
+                    fs.client.path_to_hosts = [('.*', cluster.namenode_hosts)]
+                    fs.client.base_uri_pattern = 'http://{host}/webhdfs/v1/'
+                result = Result(name)
+                scenario(fs, cluster, args, result)
+                result.stop()
+                fs.destroy('/')
+                result.report(cluster.requests)
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
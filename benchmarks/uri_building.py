@@ -0,0 +1,135 @@
+"""
+Per-request overhead of building the request URI and resolving federation
+and HA in PyWebHdfsClient._resolve_host, without any network I/O:
+
+* legacy: the URI formatted with str.format for every request and again
+  for every host, and the federation regexps matched uncompiled
+* current: precompiled federation regexps, base URIs cached per host and
+  the URI joined in one go
+
+    python -m benchmarks.uri_building [--requests 200000] [--federation 8]
+
+--federation puts that many mount points in front of the catch-all one,
+as in a federated cluster.
+"""
+import argparse
+import re
+import time
+from http import HTTPStatus
+from urllib.parse import quote, quote_plus
+
+from pywebhdfs import errors, operations
+from pywebhdfs.webhdfs import (PyWebHdfsClient, _is_standby_exception,
+                                _move_active_host_to_head)
+
+
+class LegacyClient(PyWebHdfsClient):
+    """
+    The URI building and federation resolution as they were before
+    """
+
+    def _create_uri(self, path, operation, **kwargs):
+        no_root_path = (path[1:] if path[0] == '/' else path)
+        path_param = quote(no_root_path.encode('utf8'))
+        operation_param = '?op={operation}'.format(operation=operation)
+        auth_param = str()
+        if self.user_name:
+            auth_param = '&user.name={user_name}'.format(
+                user_name=self.user_name)
+        keyword_params = str()
+        for key in kwargs:
+            try:
+                value = quote_plus(kwargs[key].encode('utf8'))
+            except:
+                value = str(kwargs[key]).lower()
+            keyword_params = '{params}&{key}={value}'.format(
+                params=keyword_params, key=key, value=value)
+        base_uri = self.base_uri_pattern.format(host="{host}")
+        return '{base_uri}{path}{operation}{keyword_args}{auth}'.format(
+            base_uri=base_uri, path=path_param,
+            operation=operation_param, keyword_args=keyword_params,
+            auth=auth_param)
+
+    def _resolve_federation(self, path):
+        for path_regexp, hosts in self.path_to_hosts:
+            if re.match(path_regexp, path):
+                return hosts
+        raise errors.CorrespondHostsNotFound(
+            msg="Could not find hosts corresponds to /{0}".format(path))
+
+    def _resolve_host(self, req_func, allow_redirect,
+                      path, operation, **kwargs):
+        uri_without_host = self._create_uri(path, operation, **kwargs)
+        hosts = self._resolve_federation(path)
+        for host in list(hosts):
+            uri = uri_without_host.format(host=host)
+            response = req_func(uri, allow_redirects=allow_redirect,
+                                timeout=self.timeout,
+                                **self.request_extra_opts)
+            if not _is_standby_exception(response):
+                _move_active_host_to_head(hosts, host)
+                return response
+
+
+class Response(object):
+    status_code = HTTPStatus.OK
+    content = b""
+
+
+def fake_get(uri, **kwargs):
+    return Response
+
+
+def make_client(client_class, federation):
+    path_to_hosts = [('/mount-{}/.*'.format(i), ['nn{}-a:9870'.format(i), 'nn{}-b:9870'.format(i)])
+                     for i in range(federation)]
+    path_to_hosts.append(('.*', ['namenode-a:9870', 'namenode-b:9870']))
+    return client_class(user_name='hdfs', path_to_hosts=path_to_hosts,
+                        base_uri_pattern='http://{host}/webhdfs/v1/')
+
+
+def measure(name, client, args):
+    paths = ['/user/hdfs/data/part-{:05d}'.format(i) for i in range(1000)]
+    started = time.perf_counter()
+    for i in range(args.requests):
+        path = paths[i % len(paths)]
+        if i % 4:
+            client._resolve_host(fake_get, True, path, operations.GETFILESTATUS)
+        else:
+            client._resolve_host(fake_get, True, path, operations.LISTSTATUS_BATCH,
+                                 startAfter='part-00001')
+    elapsed = time.perf_counter() - started
+    print("{:8} {:>10.0f} requests/s {:>8.2f} us/request".format(
+        name, args.requests / elapsed, elapsed / args.requests * 1e6))
+
+
+def check_same_uris(legacy, current):
+    captured = []
+
+    def capture(uri, **kwargs):
+        captured.append(uri)
+        return Response
+
+    for path, kwargs in [('/user/hdfs/a b+c', {}), ('relative/ü', {'offset': 5}),
+                         ('/x', {'overwrite': True, 'permission': '755'}),
+                         ('/x', {'startAfter': 'a&b'})]:
+        for client in (legacy, current):
+            client._resolve_host(capture, False, path, operations.OPEN, **kwargs)
+        assert captured[-1] == captured[-2], captured[-2:]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=200000)
+    parser.add_argument('--federation', type=int, default=0, metavar='<mount points>')
+    args = parser.parse_args()
+
+    legacy = make_client(LegacyClient, args.federation)
+    current = make_client(PyWebHdfsClient, args.federation)
+    check_same_uris(legacy, current)
+    measure('legacy', legacy, args)
+    measure('current', current, args)
+
+
+if __name__ == '__main__':
+    main()
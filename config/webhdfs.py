@@ -1,4 +1,5 @@
 import argparse
+import os
 from dataclasses import dataclass
 from sys import argv
 
@@ -16,6 +17,41 @@ class WebHDFSConfig:
 
     mountpoint: str = None
     logfile: str = None
+    log_level: str = None
+    log_sample_rate: float = 1
+
+    stat_ttl: float = 30
+    listdir_ttl: float = 30
+    enoent_ttl: float = 30
+    max_stale: float = 0
+    metadata_cache_entries: int = 100000
+    metadata_snapshot: str = None
+    summary_ttl: float = 60
+    prefetch_depth: int = 0
+    prefetch_workers: int = 8
+    snapshot_max_stale: float = 86400
+
+    block_size: int = 4
+    cache_size: int = 256
+    readahead: int = 8
+    parallel_reads: int = 4
+    disk_cache: str = None
+    disk_cache_size: int = 10240
+
+    threads: bool = False
+
+    redirect_ttl: int = 60
+    max_host_connections: int = 10
+    idle_timeout: float = 30
+    tcp_keepalive: int = 60
+
+    write_buffer_size: int = 64
+    stream_uploads: bool = False
+
+    metrics_port: int = None
+    slow_op_threshold: float = 5
+    profile_dir: str = None
+    profile_duration: float = 30
 
 
 class Split(argparse.Action):
@@ -33,11 +69,26 @@ class Split(argparse.Action):
 
 DEFAULT_HDFS_PORT = '30070'
 DEFAULT_PROXY_PORT = '1080'
-
-
-def commandline_parser():
-    parser = argparse.ArgumentParser()
-
+DEFAULT_CACHE_TTL = 30
+DEFAULT_METADATA_CACHE_ENTRIES = 100000
+DEFAULT_SNAPSHOT_MAX_STALE = 86400
+DEFAULT_SUMMARY_TTL = 60
+DEFAULT_PREFETCH_WORKERS = 8
+DEFAULT_BLOCK_SIZE = 4
+DEFAULT_CACHE_SIZE = 256
+DEFAULT_READAHEAD = 8
+DEFAULT_PARALLEL_READS = 4
+DEFAULT_DISK_CACHE_SIZE = 10240
+DEFAULT_REDIRECT_TTL = 60
+DEFAULT_MAX_HOST_CONNECTIONS = 10
+DEFAULT_IDLE_TIMEOUT = 30
+DEFAULT_TCP_KEEPALIVE = 60
+DEFAULT_WRITE_BUFFER_SIZE = 64
+DEFAULT_SLOW_OP_THRESHOLD = 5
+DEFAULT_PROFILE_DURATION = 30
+
+
+def add_connection_arguments(parser):
     parser.add_argument('hdfs_host:hdfs_port', action=Split,
                         default=f':{DEFAULT_HDFS_PORT}',
                         metavar='<server[:port]>',
@@ -45,20 +96,138 @@ def commandline_parser():
                              f'it is assumed to be {DEFAULT_HDFS_PORT}')
 
     parser.add_argument('--user.name', dest='hdfs_user_name', help='HDFS user name')
-    parser.add_argument('--logfile', help='Optional file to log all fs operations')
 
     parser.add_argument('--socks5h', action=Split, dest='proxy_host:proxy_port', default=f':{DEFAULT_PROXY_PORT}',
                         metavar='<host[:port]>',
                         help=f'If the port number is not specified, '
                              f'it is assumed to be {DEFAULT_PROXY_PORT}')
 
+
+def commandline_parser():
+    parser = argparse.ArgumentParser()
+
+    add_connection_arguments(parser)
+    parser.add_argument('--logfile', help='Optional file to log to')
+    parser.add_argument('--log-level', choices=['debug', 'info', 'warning', 'error'],
+                        help='Level of the logged messages, info with --logfile and warning without '
+                             'by default. debug logs every file system operation')
+    parser.add_argument('--log-sample-rate', type=float, default=1, metavar='<fraction>',
+                        help='Fraction of the debug and info messages which are logged, all of them '
+                             'by default. Warnings and errors are always logged')
+
+    parser.add_argument('--stat-ttl', type=float, default=DEFAULT_CACHE_TTL, metavar='<seconds>',
+                        help=f'How long file and directory attributes are cached, '
+                             f'{DEFAULT_CACHE_TTL} seconds by default')
+    parser.add_argument('--listdir-ttl', type=float, default=DEFAULT_CACHE_TTL, metavar='<seconds>',
+                        help=f'How long directory listings are cached, '
+                             f'{DEFAULT_CACHE_TTL} seconds by default')
+    parser.add_argument('--enoent-ttl', type=float, default=DEFAULT_CACHE_TTL, metavar='<seconds>',
+                        help=f'How long paths which turned out not to exist are cached, '
+                             f'{DEFAULT_CACHE_TTL} seconds by default')
+    parser.add_argument('--max-stale', type=float, default=0, metavar='<seconds>',
+                        help='Serve expired attributes and listings for up to this many seconds while '
+                             'they are refreshed in the background, and refresh frequently used ones '
+                             'before they expire. Disabled (0) by default')
+    parser.add_argument('--metadata-cache-entries', type=int, default=DEFAULT_METADATA_CACHE_ENTRIES,
+                        metavar='<entries>',
+                        help=f'Maximum number of entries of each of the metadata caches, '
+                             f'least recently used entries are evicted first. '
+                             f'{DEFAULT_METADATA_CACHE_ENTRIES} by default')
+    parser.add_argument('--metadata-snapshot', metavar='<file>',
+                        help='File to save the metadata cache to on unmount. It is loaded on the next '
+                             'mount and served while it is revalidated in the background')
+    parser.add_argument('--snapshot-max-stale', type=float, default=DEFAULT_SNAPSHOT_MAX_STALE,
+                        metavar='<seconds>',
+                        help=f'Maximum age of the metadata snapshot entries which are served before '
+                             f'they are revalidated, {DEFAULT_SNAPSHOT_MAX_STALE} seconds by default')
+    parser.add_argument('--summary-ttl', type=float, default=DEFAULT_SUMMARY_TTL, metavar='<seconds>',
+                        help=f'How long directory content summaries and the file system usage '
+                             f'reported by df are cached, {DEFAULT_SUMMARY_TTL} seconds by default')
+    parser.add_argument('--prefetch-depth', type=int, default=0, metavar='<levels>',
+                        help='List subdirectories of listed directories in the background, this many '
+                             'levels deep, ahead of recursive walks like find or du. Disabled (0) '
+                             'by default')
+    parser.add_argument('--prefetch-workers', type=int, default=DEFAULT_PREFETCH_WORKERS,
+                        metavar='<threads>',
+                        help=f'Number of directories listed concurrently by the prefetcher, '
+                             f'{DEFAULT_PREFETCH_WORKERS} by default')
+
+    parser.add_argument('--block-size', type=int, default=DEFAULT_BLOCK_SIZE, metavar='<MB>',
+                        help=f'Size of the read cache blocks, {DEFAULT_BLOCK_SIZE} MB by default')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE, metavar='<MB>',
+                        help=f'Memory budget of the read cache, {DEFAULT_CACHE_SIZE} MB by default. '
+                             f'0 disables caching')
+    parser.add_argument('--readahead', type=int, default=DEFAULT_READAHEAD, metavar='<blocks>',
+                        help=f'Maximum number of blocks to prefetch on sequential reads, '
+                             f'{DEFAULT_READAHEAD} by default')
+    parser.add_argument('--parallel-reads', type=int, default=DEFAULT_PARALLEL_READS, metavar='<requests>',
+                        help=f'Number of concurrent requests reading the blocks of a single readahead, '
+                             f'{DEFAULT_PARALLEL_READS} by default. 1 reads them with a single request')
+    parser.add_argument('--disk-cache', metavar='<directory>',
+                        help='Local directory to keep read blocks in across remounts')
+    parser.add_argument('--disk-cache-size', type=int, default=DEFAULT_DISK_CACHE_SIZE, metavar='<MB>',
+                        help=f'Size limit of the disk cache, {DEFAULT_DISK_CACHE_SIZE} MB by default')
+
+    parser.add_argument('--threads', action='store_true',
+                        help='Serve file system requests from multiple threads concurrently')
+
+    parser.add_argument('--redirect-ttl', type=int, default=DEFAULT_REDIRECT_TTL, metavar='<seconds>',
+                        help=f'How long to reuse the datanode location of a file block for reads '
+                             f'without asking the namenode, {DEFAULT_REDIRECT_TTL} seconds by default. '
+                             f'0 disables it')
+    parser.add_argument('--max-host-connections', type=int, default=DEFAULT_MAX_HOST_CONNECTIONS,
+                        metavar='<connections>',
+                        help=f'Maximum number of connections kept open to the namenode and to every '
+                             f'datanode per thread, {DEFAULT_MAX_HOST_CONNECTIONS} by default')
+    parser.add_argument('--idle-timeout', type=float, default=DEFAULT_IDLE_TIMEOUT, metavar='<seconds>',
+                        help=f'Close rather than reuse connections which have been idle for this long, '
+                             f'as the servers may have closed them already, {DEFAULT_IDLE_TIMEOUT} seconds '
+                             f'by default')
+    parser.add_argument('--tcp-keepalive', type=int, default=DEFAULT_TCP_KEEPALIVE, metavar='<seconds>',
+                        help=f'Send TCP keepalive probes on connections idle for this long, '
+                             f'{DEFAULT_TCP_KEEPALIVE} seconds by default. 0 disables them')
+
+    parser.add_argument('--write-buffer-size', type=int, default=DEFAULT_WRITE_BUFFER_SIZE, metavar='<MB>',
+                        help=f'Amount of data written to a file which is buffered before it is sent '
+                             f'to HDFS, {DEFAULT_WRITE_BUFFER_SIZE} MB by default. '
+                             f'The buffer is also sent on flush, fsync and close')
+    parser.add_argument('--stream-uploads', action='store_true',
+                        help='Stream the data written to new files to HDFS with a single chunked '
+                             'upload request per file, instead of buffering it')
+
+    parser.add_argument('--metrics-port', type=int, metavar='<port>',
+                        help='Serve operation counts, latency histograms and cache statistics in the '
+                             'Prometheus text format on this local port, at http://127.0.0.1:<port>/metrics')
+    parser.add_argument('--slow-op-threshold', type=float, default=DEFAULT_SLOW_OP_THRESHOLD,
+                        metavar='<seconds>',
+                        help=f'Log the stack of file system operations running for longer than this, '
+                             f'{DEFAULT_SLOW_OP_THRESHOLD} seconds by default. 0 disables it')
+    parser.add_argument('--profile-dir', metavar='<directory>',
+                        help='Profile all threads of the mount when it receives SIGUSR2, and write '
+                             'the profile as collapsed stacks and pstats to this directory')
+    parser.add_argument('--profile-duration', type=float, default=DEFAULT_PROFILE_DURATION,
+                        metavar='<seconds>',
+                        help=f'How long to profile for on SIGUSR2, {DEFAULT_PROFILE_DURATION} seconds '
+                             f'by default')
+
     return parser
 
 
+def base_url(hdfs_host, hdfs_port):
+    return f"http://{hdfs_host}:{hdfs_port}/webhdfs/v1/"
+
+
 def configure(parser=commandline_parser()):
     args = parser.parse_args(argv[1:])
 
-    args.hdfs_baseurl = f"http://{args.hdfs_host}:{args.hdfs_port}/webhdfs/v1/"
+    args.hdfs_baseurl = base_url(args.hdfs_host, args.hdfs_port)
+    # FUSE changes to / when it daemonizes the process
+    if args.disk_cache:
+        args.disk_cache = os.path.abspath(args.disk_cache)
+    if args.metadata_snapshot:
+        args.metadata_snapshot = os.path.abspath(args.metadata_snapshot)
+    if args.profile_dir:
+        args.profile_dir = os.path.abspath(args.profile_dir)
     config = WebHDFSConfig(**args.__dict__)
     return config
 
@@ -0,0 +1,102 @@
+import logging
+import logging.handlers
+import queue
+import random
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(threadName)s %(name)s: %(message)s'
+
+# The extra of records which were sampled by the caller already, see
+# SamplingFilter
+SAMPLED = {'sampled': True}
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Passes a random sample_rate fraction of the records below WARNING, and
+    all warnings and errors. Records logged with extra=SAMPLED are passed
+    as well: their callers sample them before the records are even
+    created, which is much cheaper.
+    """
+
+    def __init__(self, sample_rate):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record):
+        return (record.levelno >= logging.WARNING or random.random() < self.sample_rate or
+                getattr(record, 'sampled', False))
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+
+    def prepare(self, record):
+        # The records never leave the process, so unlike the default they
+        # don't have to be formatted to be picklable. They are formatted
+        # by the writer thread instead.
+        return record
+
+
+class LogSummary(object):
+    """
+    Formats a value for the log lazily, with the contents of data buffers
+    replaced by their size
+    """
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return _summarize(self.value)
+
+
+def _summarize(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return '<{} bytes>'.format(len(value))
+    if isinstance(value, tuple):
+        return '(' + ', '.join(_summarize(item) for item in value) + ')'
+    return repr(value)
+
+
+class AsyncLogWriter(object):
+    """
+    Sends the records of the root logger at level or above to a file
+    (or stderr), formatted and written by a writer thread, so that logging
+    threads only queue them. Only a sample_rate fraction of the records
+    below WARNING is kept.
+
+    The writer thread is started by start(), i.e. after FUSE has daemonized
+    the process. Records logged before are queued until then.
+    """
+
+    def __init__(self, level, filename=None, sample_rate=1.0):
+        if filename:
+            handler = logging.FileHandler(filename)
+        else:
+            handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        log_queue = queue.SimpleQueue()
+        self._listener = logging.handlers.QueueListener(log_queue, handler)
+        self.sample_rate = sample_rate
+        self._started = False
+        self.handler = _QueueHandler(log_queue)
+        if sample_rate < 1:
+            self.handler.addFilter(SamplingFilter(sample_rate))
+        root = logging.getLogger()
+        root.setLevel(level)
+        root.addHandler(self.handler)
+
+    def start(self):
+        if not self._started:
+            self._started = True
+            self._listener.start()
+
+    def stop(self):
+        """
+        Write the queued records and stop the writer thread
+        """
+        if self._started:
+            self._started = False
+            self._listener.stop()
+        for handler in self._listener.handlers:
+            handler.flush()
@@ -0,0 +1,111 @@
+from collections import OrderedDict
+import threading
+
+
+class BlockCache(object):
+    """
+    An in-memory LRU cache of aligned file blocks.
+
+    Blocks are keyed by (path, block index, mtime, size), so a file that
+    changes on HDFS never serves stale data: its old blocks are simply
+    never looked up again and age out of the cache. Blocks are stored
+    as they are put, normally read-only memoryviews, so that readers can
+    slice them without copying. Lookups and evictions are counted in
+    hits, misses and evictions.
+    """
+
+    def __init__(self, block_size, max_bytes):
+        self.block_size = block_size
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._blocks = OrderedDict()
+        self._paths = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self):
+        """
+        The number of whole blocks which fit into the cache
+        """
+        return self.max_bytes // self.block_size
+
+    @property
+    def cached_bytes(self):
+        return self._bytes
+
+    def get(self, path, index, version):
+        key = (path, index) + version
+        with self._lock:
+            block = self._blocks.get(key)
+            if block is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._blocks.move_to_end(key)
+        return block
+
+    def put(self, path, index, version, block):
+        if len(block) > self.max_bytes:
+            return
+        key = (path, index) + version
+        with self._lock:
+            old = self._blocks.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._blocks[key] = block
+            self._paths.setdefault(path, set()).add(key)
+            self._bytes += len(block)
+            while self._bytes > self.max_bytes:
+                self._evict()
+
+    def invalidate(self, path):
+        with self._lock:
+            for key in self._paths.pop(path, ()):
+                block = self._blocks.pop(key, None)
+                if block is not None:
+                    self._bytes -= len(block)
+
+    def _evict(self):
+        key, block = self._blocks.popitem(last=False)
+        self._bytes -= len(block)
+        self.evictions += 1
+        keys = self._paths.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._paths[key[0]]
+
+
+class ReadaheadDetector(object):
+    """
+    Detects sequential reads per path and tells how many blocks to prefetch.
+
+    The readahead window starts at one block once two consecutive reads
+    touch adjacent offsets and doubles with every further sequential read
+    up to max_blocks. A random access resets it.
+    """
+
+    def __init__(self, max_blocks, max_paths=1024):
+        self.max_blocks = max_blocks
+        self.max_paths = max_paths
+        self._state = OrderedDict()
+        self._lock = threading.Lock()
+
+    def update(self, path, offset, size):
+        with self._lock:
+            last_end, window = self._state.pop(path, (None, 0))
+            if offset == last_end:
+                window = min(max(window * 2, 1), self.max_blocks)
+            else:
+                window = 0
+            self._state[path] = (offset + size, window)
+            if len(self._state) > self.max_paths:
+                self._state.popitem(last=False)
+        return window
+
+    def forget(self, path):
+        with self._lock:
+            self._state.pop(path, None)
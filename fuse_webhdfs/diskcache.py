@@ -0,0 +1,175 @@
+from collections import OrderedDict
+import hashlib
+import logging
+import mmap
+import os
+import queue
+import tempfile
+import threading
+
+logger = logging.getLogger('Webhdfs')
+
+
+class DiskBlockCache(object):
+    """
+    A persistent LRU cache of file blocks in a local directory, which
+    survives remounts.
+
+    Every block is stored in its own file named after the path, length and
+    modification time of the HDFS file (and the block size), so a file that
+    changes on HDFS is never served from stale blocks. The LRU order is
+    kept in the modification times of the block files, so that it is
+    restored on the next mount. Blocks are served as read-only memoryviews
+    of a mmap of their file.
+
+    Blocks given to put_async() are written by a background thread, so that
+    reads don't wait for the disk. At most max_pending blocks wait to be
+    written, and are served by get() meanwhile; further ones are not
+    cached, and counted in dropped.
+    """
+
+    def __init__(self, directory, max_bytes, block_size, max_pending=16):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.dropped = 0
+        self._pending = queue.Queue(maxsize=max_pending)
+        # The blocks waiting to be written, by name
+        self._pending_blocks = {}
+        self._writer = None
+        self._blocks = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            file_path = os.path.join(self.directory, name)
+            if name.startswith('.'):
+                # Left behind by an interrupted put
+                os.unlink(file_path)
+                continue
+            st = os.stat(file_path)
+            entries.append((st.st_mtime, name, st.st_size))
+        for _, name, size in sorted(entries):
+            self._blocks[name] = size
+            self._bytes += size
+        with self._lock:
+            self._evict()
+        logger.info("Disk cache %s: %d blocks, %d bytes",
+                    self.directory, len(self._blocks), self._bytes)
+
+    def _name(self, path, index, version):
+        mtime, size = version
+        key = '{}\0{}\0{}\0{}'.format(path, size, mtime, self.block_size)
+        return '{}.{}'.format(
+            hashlib.sha1(key.encode('utf8')).hexdigest(), index)
+
+    @property
+    def cached_bytes(self):
+        return self._bytes
+
+    def get(self, path, index, version):
+        name = self._name(path, index, version)
+        with self._lock:
+            block = self._pending_blocks.get(name)
+            if block is not None:
+                self.hits += 1
+                return block
+            if name not in self._blocks:
+                self.misses += 1
+                return None
+            self._blocks.move_to_end(name)
+            self.hits += 1
+        file_path = os.path.join(self.directory, name)
+        try:
+            with open(file_path, 'rb') as f:
+                block = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            os.utime(file_path)
+        except (OSError, ValueError):
+            with self._lock:
+                self._forget(name)
+            return None
+        return memoryview(block)
+
+    def put(self, path, index, version, block):
+        if not len(block) or len(block) > self.max_bytes:
+            return
+        name = self._name(path, index, version)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(block)
+            os.replace(tmp_path, os.path.join(self.directory, name))
+        except OSError as e:
+            logger.warning("Can't write block to disk cache: %s", e)
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            return
+        with self._lock:
+            self._forget(name)
+            self._blocks[name] = len(block)
+            self._bytes += len(block)
+            self._evict()
+
+    def put_async(self, path, index, version, block):
+        name = self._name(path, index, version)
+        with self._lock:
+            if self._writer is None:
+                # Started on first use, i.e. after FUSE has daemonized the process
+                self._writer = threading.Thread(target=self._write_pending,
+                                                name='webhdfs-disk-cache', daemon=True)
+                self._writer.start()
+            self._pending_blocks[name] = block
+        try:
+            self._pending.put_nowait((path, index, version, block))
+        except queue.Full:
+            with self._lock:
+                self._pending_blocks.pop(name, None)
+                self.dropped += 1
+
+    def _write_pending(self):
+        while True:
+            path, index, version, block = self._pending.get()
+            try:
+                self.put(path, index, version, block)
+            except Exception as e:
+                logger.warning("Can't write block to disk cache: %s", e)
+            finally:
+                with self._lock:
+                    self._pending_blocks.pop(self._name(path, index, version), None)
+                self._pending.task_done()
+
+    def flush(self):
+        """
+        Wait until the blocks given to put_async() are written
+        """
+        self._pending.join()
+
+    def _forget(self, name):
+        size = self._blocks.pop(name, None)
+        if size is not None:
+            self._bytes -= size
+
+    def _evict(self):
+        while self._bytes > self.max_bytes:
+            name, size = self._blocks.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return dict(blocks=len(self._blocks), bytes=self._bytes,
+                        hits=self.hits, misses=self.misses,
+                        evictions=self.evictions, dropped=self.dropped,
+                        hit_rate=self.hits / lookups if lookups else 0.0)
@@ -0,0 +1,258 @@
+from collections import OrderedDict
+import posixpath
+import threading
+import time
+
+
+def join_path(parent, name):
+    """
+    The cache key of a directory entry: '/' + name in the root directory,
+    not '//' + name
+    """
+    if parent.endswith('/'):
+        return parent + name
+    return parent + '/' + name
+
+
+def split_path(path):
+    """
+    Split a normalized path into its parent directory and name
+    """
+    parent, name = posixpath.split(path)
+    return parent or '/', name
+
+
+class TTLCache(object):
+    """
+    A thread-safe LRU cache with at most max_entries entries which
+    expire ttl seconds after they were stored.
+
+    Entries can be given a grace period after they expired, max_stale
+    seconds by default, in which lookup() still returns them, flagged as
+    stale, so that the caller can use them while they are being refreshed.
+    Entries which are looked up at least hot_hits times are flagged for
+    refresh as well once they are in the last refresh_ahead fraction of
+    their ttl, so that they are refreshed before they expire.
+    Lookups and evictions are counted in hits, misses and evictions.
+    """
+
+    def __init__(self, ttl, max_entries, max_stale=0, refresh_ahead=0.25, hot_hits=3):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_stale = max_stale
+        self.refresh_ahead = refresh_ahead
+        self.hot_hits = hot_hits
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        """
+        Whether the key is cached, fresh or stale, without counting a hit
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and time.monotonic() <= entry[1]
+
+    def lookup(self, key):
+        """
+        Return (value, fresh), or (None, False) if the key is missing or
+        expired beyond its grace period. fresh is False for stale entries
+        and for hot entries due for a refresh ahead of their expiry.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, False
+            expires, stale_until, value, hits = entry
+            now = time.monotonic()
+            if stale_until < now:
+                del self._entries[key]
+                self.misses += 1
+                return None, False
+            self.hits += 1
+            self._entries.move_to_end(key)
+            if now > expires:
+                return value, False
+            hits += 1
+            if (hits >= self.hot_hits and stale_until > expires and
+                    expires - now < self.ttl * self.refresh_ahead):
+                # Only flagged once, until the refreshed value is put
+                entry[3] = float('-inf')
+                return value, False
+            entry[3] = hits
+            return value, True
+
+    def get(self, key):
+        """
+        Return the value if it is cached and not expired, else None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def peek(self, key):
+        """
+        Return the value if it is cached, fresh or stale, else None, without
+        counting a hit or a miss or refreshing its LRU position
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                return None
+            return entry[2]
+
+    def put(self, key, value):
+        self.update(((key, value),))
+
+    def update(self, items, ttl=None, max_stale=None):
+        """
+        Store the (key, value) items for ttl seconds (def: self.ttl), and
+        keep them as stale for another max_stale seconds (def: self.max_stale)
+        """
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        stale_until = expires + (self.max_stale if max_stale is None else max_stale)
+        with self._lock:
+            for key, value in items:
+                self._entries.pop(key, None)
+                self._entries[key] = [expires, stale_until, value, 0]
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return entry[2] if entry is not None else None
+
+    def items(self):
+        """
+        A list of the (key, value, age) items, including stale ones, age
+        being the number of seconds since they were fetched, i.e. stored with
+        the default ttl. See store_aged() for items stored with their age.
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [(key, entry[2], now - entry[0] + self.ttl)
+                    for key, entry in self._entries.items() if now <= entry[1]]
+
+    def store_aged(self, key, value, age, max_age):
+        """
+        Store an item fetched age seconds ago as stale, e.g. loaded from a
+        snapshot, to be used until it is refreshed and at most until it is
+        max_age seconds old. Its age is kept for items(), where it is
+        overestimated by up to ttl for items younger than ttl.
+        """
+        expires_in = -max(age - self.ttl, 0)
+        self.update(((key, value),), ttl=expires_in,
+                    max_stale=max_age - age - expires_in)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class MetadataCache(object):
+    """
+    The metadata known about the file system: file statuses, directory
+    listings, paths known not to exist and content summaries (with the file
+    system status under None), each with its own TTL. Statuses
+    and listings are served stale for up to max_stale seconds after they
+    expired. All of them are keyed by normalized absolute paths, see
+    join_path(), and listings are stored as dicts with the entry names as
+    keys, in listing order.
+
+    Statuses and listings fetched from the namenode are stored with
+    put_stat() and put_listing(), given the generation() from before they
+    were fetched. They are dropped if their directory was invalidated in
+    the meantime, as they may be older than the change which invalidated it.
+    """
+
+    def __init__(self, stat_ttl, listdir_ttl, enoent_ttl, max_entries, max_stale=0,
+                 summary_ttl=60, max_summaries=1024):
+        self.stats = TTLCache(stat_ttl, max_entries, max_stale=max_stale)
+        self.listdirs = TTLCache(listdir_ttl, max_entries, max_stale=max_stale)
+        self.enoent = TTLCache(enoent_ttl, max_entries)
+        self.summaries = TTLCache(summary_ttl, max_summaries)
+        # The generation of the last invalidation of every directory, for
+        # the last max_entries of them. The others are known to have been
+        # invalidated at _forgotten_generation at the latest.
+        self._generation = 0
+        self._invalidations = OrderedDict()
+        self._forgotten_generation = 0
+        self._max_invalidations = max_entries
+        self._lock = threading.Lock()
+
+    def generation(self):
+        return self._generation
+
+    def _invalidated(self, directory):
+        self._generation += 1
+        self._invalidations.pop(directory, None)
+        self._invalidations[directory] = self._generation
+        if len(self._invalidations) > self._max_invalidations:
+            _, self._forgotten_generation = self._invalidations.popitem(last=False)
+
+    def _changed_since(self, directory, generation):
+        return self._invalidations.get(directory, self._forgotten_generation) > generation
+
+    def invalidate(self, path):
+        """
+        Forget what is known about the path, including its parent listing
+        """
+        parent = split_path(path)[0]
+        with self._lock:
+            self._invalidated(parent)
+            self.stats.pop(path)
+            self.enoent.pop(path)
+            self.listdirs.pop(parent)
+
+    def invalidate_listing(self, path):
+        """
+        Forget the listing of the directory
+        """
+        with self._lock:
+            self._invalidated(path)
+            self.listdirs.pop(path)
+
+    def put_stat(self, path, st, generation):
+        with self._lock:
+            if self._changed_since(split_path(path)[0], generation):
+                return False
+            self.stats.put(path, st)
+        return True
+
+    def put_listing(self, path, names, generation):
+        with self._lock:
+            if self._changed_since(path, generation):
+                return False
+            self.listdirs.put(path, names)
+        return True
+
+    def is_missing(self, path):
+        """
+        Whether the path is known not to exist, either directly, because
+        a fresh listing of its parent directory doesn't contain it, or
+        because its parent is a file
+        """
+        if self.enoent.get(path):
+            return True
+        if path == '/':
+            return False
+        parent, name = split_path(path)
+        names = self.listdirs.get(parent)
+        if names is not None:
+            return name not in names
+        parent_st = self.stats.get(parent)
+        return parent_st is not None and not parent_st.is_dir
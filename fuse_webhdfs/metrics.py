@@ -0,0 +1,147 @@
+from bisect import bisect_left
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging
+import threading
+
+logger = logging.getLogger('Webhdfs')
+
+# Upper bounds of the latency histogram buckets, in seconds, from cached
+# metadata lookups up to reads of whole blocks over a slow network
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _labels_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(labels, **extra):
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in items) + '}'
+
+
+class Metrics(object):
+    """
+    Thread-safe counters and latency histograms, rendered in the Prometheus
+    text format.
+
+    Every sample is identified by a metric name and keyword labels. Values
+    which are cheaper to read when scraped than to keep up to date, like
+    cache sizes, are reported by collectors: functions returning
+    (name, type, labels dict, value) samples.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._counters = defaultdict(int)
+        # Per bucket counts, the +Inf bucket count and the sum of the values
+        self._histograms = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._counters[key] += value
+
+    def observe(self, name, value, **labels):
+        key = (name, _labels_key(labels))
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            histogram[index] += 1
+            histogram[-1] += value
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, list(histogram))
+                                for key, histogram in self._histograms.items())
+        lines = []
+        typed = set()
+
+        def add_type(name, metric_type):
+            if name not in typed:
+                typed.add(name)
+                lines.append('# TYPE {} {}'.format(name, metric_type))
+
+        for (name, labels), value in counters:
+            add_type(name, 'counter')
+            lines.append('{}{} {}'.format(name, _format_labels(labels), value))
+        for (name, labels), histogram in histograms:
+            add_type(name, 'histogram')
+            count = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), histogram):
+                count += bucket_count
+                lines.append('{}_bucket{} {}'.format(
+                    name, _format_labels(labels, le=bound), count))
+            lines.append('{}_sum{} {}'.format(name, _format_labels(labels), histogram[-1]))
+            lines.append('{}_count{} {}'.format(name, _format_labels(labels), count))
+        for collector in self._collectors:
+            try:
+                samples = sorted(collector(), key=lambda sample: sample[0])
+            except Exception as e:
+                logger.warning("Metrics collector %s failed: %s", collector, e)
+                continue
+            for name, metric_type, labels, value in samples:
+                add_type(name, metric_type)
+                lines.append('{}{} {}'.format(
+                    name, _format_labels(_labels_key(labels)), value))
+        return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        body = self.server.metrics.render().encode('utf8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer(object):
+    """
+    Serves the metrics in the Prometheus text format on a local port, from
+    a daemon thread started by start(), i.e. after FUSE has daemonized the
+    process.
+    """
+
+    def __init__(self, metrics, port, host='127.0.0.1'):
+        self.metrics = metrics
+        self.port = port
+        self.host = host
+        self._server = None
+
+    def start(self):
+        try:
+            self._server = ThreadingHTTPServer((self.host, self.port), _MetricsHandler)
+        except OSError as e:
+            logger.warning("Can't serve metrics on %s:%d: %s", self.host, self.port, e)
+            return
+        self._server.daemon_threads = True
+        self._server.metrics = self.metrics
+        threading.Thread(target=self._server.serve_forever, name='webhdfs-metrics',
+                         daemon=True).start()
+        logger.info("Serving metrics on http://%s:%d/metrics", self.host, self.port)
+
+    def stop(self):
+        server, self._server = self._server, None
+        if server is not None:
+            server.shutdown()
+            server.server_close()
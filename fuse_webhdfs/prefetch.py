@@ -0,0 +1,87 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+
+logger = logging.getLogger('Webhdfs')
+
+
+class DirectoryPrefetcher(object):
+    """
+    Lists subdirectories concurrently, ahead of a walk over the tree.
+
+    list_dir(path, depth) is called in a pool of max_workers threads for
+    every prefetched directory, and is expected to call prefetch() with its
+    own subdirectories and depth + 1. Directories deeper than max_depth
+    levels below the directory listed by the user are not prefetched, and
+    neither are any directories beyond max_pending queued ones. The pool
+    is started on the first prefetch, i.e. after FUSE has daemonized the
+    process.
+    """
+
+    def __init__(self, list_dir, max_depth, max_workers, max_pending=10000):
+        self._list_dir = list_dir
+        self.max_depth = max_depth
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._stopped = False
+
+    def prefetch(self, paths, depth=1):
+        """
+        Queue the directories for prefetching. Returns whether all of them
+        are queued or running, rather than dropped.
+        """
+        if depth > self.max_depth:
+            return False
+        with self._lock:
+            if self._stopped:
+                return False
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix='webhdfs-prefetch')
+            for path in paths:
+                if path in self._pending:
+                    continue
+                if len(self._pending) >= self.max_pending:
+                    return False
+                self._pending[path] = self._executor.submit(self._run, path, depth)
+        return True
+
+    def _run(self, path, depth):
+        try:
+            self._list_dir(path, depth)
+        except Exception as e:
+            logger.debug("Can't prefetch %s: %s", path, e)
+        finally:
+            with self._lock:
+                self._pending.pop(path, None)
+
+    def wait(self, path):
+        """
+        Called before listing a directory: waits for its prefetch if it
+        is already running, or cancels it if it is still queued
+        """
+        with self._lock:
+            future = self._pending.get(path)
+            if future is None:
+                return
+            if future.cancel():
+                del self._pending[path]
+                return
+        try:
+            future.result()
+        except Exception:
+            pass
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            executor, self._executor = self._executor, None
+            for future in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+        if executor is not None:
+            executor.shutdown(wait=False)
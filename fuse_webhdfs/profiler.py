@@ -0,0 +1,227 @@
+from collections import Counter, deque
+import logging
+import marshal
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+
+logger = logging.getLogger('Webhdfs')
+
+
+def _frame_key(frame):
+    code = frame.f_code
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+def _thread_stacks(exclude):
+    """
+    The stacks of all threads but exclude, as (thread name, tuple of frame
+    keys from the outermost frame to the innermost one)
+    """
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    for ident, frame in sys._current_frames().items():
+        if ident == exclude:
+            continue
+        stack = []
+        while frame is not None:
+            stack.append(_frame_key(frame))
+            frame = frame.f_back
+        stack.reverse()
+        yield names.get(ident, str(ident)), tuple(stack)
+
+
+def write_collapsed(filename, samples):
+    """
+    Write the sampled stacks in the collapsed format of flamegraph.pl and
+    speedscope: one line per stack with its frames separated by ';',
+    rooted at the thread name, and the number of samples
+    """
+    with open(filename, 'w') as f:
+        for (thread_name, stack), count in samples.most_common():
+            frames = [thread_name.replace(';', ':')]
+            frames.extend('{} ({}:{})'.format(name, os.path.basename(path), line)
+                          for path, line, name in stack)
+            f.write('{} {}\n'.format(';'.join(frames), count))
+
+
+def write_pstats(filename, samples, interval):
+    """
+    Write the sampled stacks as a pstats file, to be read with
+    pstats.Stats or snakeviz. Call counts are sample counts, the times are
+    estimated from the sampling interval.
+    """
+    stats = {}
+    for (_, stack), count in samples.items():
+        elapsed = count * interval
+        seen = set()
+        for depth, func in enumerate(stack):
+            cc, nc, tt, ct, callers = stats.setdefault(func, (0, 0, 0.0, 0.0, {}))
+            if func in seen:
+                # A recursive call, its time is counted once
+                continue
+            seen.add(func)
+            if depth == len(stack) - 1:
+                tt += elapsed
+            stats[func] = (cc + count, nc + count, tt, ct + elapsed, callers)
+            if depth:
+                caller = stack[depth - 1]
+                c_nc, c_cc, c_tt, c_ct = callers.get(caller, (0, 0, 0.0, 0.0))
+                callers[caller] = (c_nc + count, c_cc + count,
+                                   c_tt + (elapsed if depth == len(stack) - 1 else 0.0),
+                                   c_ct + elapsed)
+    with open(filename, 'wb') as f:
+        marshal.dump(stats, f)
+
+
+class SamplingProfiler(object):
+    """
+    Samples the stacks of all threads every interval seconds for duration
+    seconds, and writes them to the directory as profile-<time>.collapsed
+    and profile-<time>.pstats, along with the slow operations recorded by
+    slow_ops.
+
+    Profiling is started by start(), or by a signal: handle_signal() has
+    to be called from the main thread before any other thread is created,
+    and watch_signal() once profiling can be started. The signal is
+    waited for by a thread, since the main thread may be blocked in libfuse
+    for good, so it is blocked in all other threads. Should it be delivered
+    to a thread created before, it is handled by the main thread.
+    """
+
+    def __init__(self, directory, duration=30, interval=0.005, slow_ops=None):
+        self.directory = directory
+        self.duration = duration
+        self.interval = interval
+        self.slow_ops = slow_ops
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def handle_signal(self, signum):
+        signal.signal(signum, lambda signum, frame: self.start())
+        # Inherited by the threads created from now on
+        signal.pthread_sigmask(signal.SIG_BLOCK, {signum})
+
+    def watch_signal(self, signum):
+        def wait_for_signal():
+            while True:
+                signal.sigwait({signum})
+                self.start()
+
+        threading.Thread(target=wait_for_signal, name='webhdfs-profile-signal',
+                         daemon=True).start()
+
+    def start(self):
+        """
+        Start profiling in the background, unless it is already running
+        """
+        with self._lock:
+            if self._thread is not None:
+                return False
+            self._thread = threading.Thread(target=self._run, name='webhdfs-profiler',
+                                            daemon=True)
+            self._thread.start()
+        return True
+
+    def _run(self):
+        try:
+            logger.warning("Profiling for %s seconds", self.duration)
+            samples = Counter()
+            me = threading.get_ident()
+            started = time.monotonic()
+            deadline = started + self.duration
+            rounds = 0
+            while time.monotonic() < deadline:
+                samples.update(_thread_stacks(me))
+                rounds += 1
+                time.sleep(self.interval)
+            # The actual interval, which sampling itself adds to
+            interval = (time.monotonic() - started) / max(rounds, 1)
+            self._write(samples, interval)
+        except Exception as e:
+            logger.warning("Profiling failed: %s", e)
+        finally:
+            with self._lock:
+                self._thread = None
+
+    def _write(self, samples, interval):
+        os.makedirs(self.directory, exist_ok=True)
+        prefix = os.path.join(self.directory, time.strftime('profile-%Y%m%d-%H%M%S'))
+        write_collapsed(prefix + '.collapsed', samples)
+        write_pstats(prefix + '.pstats', samples, interval)
+        if self.slow_ops is not None:
+            with open(prefix + '.slow-ops.txt', 'w') as f:
+                for record in self.slow_ops.recent():
+                    f.write(record)
+                    f.write('\n')
+        logger.warning("Wrote profile %s.*", prefix)
+
+
+class SlowOperationTracker(object):
+    """
+    Records the stacks of the file system operations running for longer
+    than threshold seconds.
+
+    Running operations are registered by begin() and end(), and checked by
+    a watchdog thread, started by start(), threshold / 2 seconds apart.
+    The stack of an operation is taken while it is still running, so that
+    it shows where the operation is stuck, e.g. waiting for the namenode
+    or busy in local code. The stacks are logged as warnings and the last
+    max_records of them are kept for recent().
+    """
+
+    def __init__(self, threshold, max_records=100, metrics=None):
+        self.threshold = threshold
+        self.metrics = metrics
+        self._running = {}
+        self._records = deque(maxlen=max_records)
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def begin(self, op, args):
+        # Every thread only sets and pops its own entry, with single dict
+        # operations, so that no lock is needed
+        self._running[threading.get_ident()] = [op, args[0] if args else None,
+                                                time.monotonic(), False]
+
+    def end(self):
+        entry = self._running.pop(threading.get_ident(), None)
+        if entry is not None and entry[3]:
+            op, path, started, _ = entry
+            logger.warning("Slow %s %s took %.3f s", op, path, time.monotonic() - started)
+
+    def recent(self):
+        return list(self._records)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch, name='webhdfs-slow-ops',
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _watch(self):
+        while not self._stopped.wait(self.threshold / 2):
+            now = time.monotonic()
+            frames = None
+            for ident, entry in list(self._running.items()):
+                op, path, started, reported = entry
+                if reported or now - started < self.threshold:
+                    continue
+                if frames is None:
+                    frames = sys._current_frames()
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                entry[3] = True
+                record = "{} {} {} running for {:.3f} s:\n{}".format(
+                    time.strftime('%Y-%m-%d %H:%M:%S'), op, path, now - started,
+                    ''.join(traceback.format_stack(frame)))
+                self._records.append(record)
+                logger.warning("Slow operation %s", record)
+                if self.metrics is not None:
+                    self.metrics.inc('webhdfs_slow_operations_total', op=op)
@@ -0,0 +1,58 @@
+from collections import OrderedDict
+import logging
+import threading
+
+logger = logging.getLogger('Webhdfs')
+
+
+class Revalidator(object):
+    """
+    Refreshes stale metadata cache entries in a background thread.
+
+    refresh(kind, path) is called for every submitted (kind, path) pair.
+    Pairs already waiting are not queued twice, and submissions beyond
+    max_pending are dropped: the entry will simply be submitted again the
+    next time it is served stale. The thread is started on the first
+    submission, i.e. after FUSE has daemonized the process.
+    """
+
+    def __init__(self, refresh, max_pending=10000):
+        self._refresh = refresh
+        self.max_pending = max_pending
+        self._pending = OrderedDict()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def submit(self, kind, path):
+        key = (kind, path)
+        with self._cond:
+            if self._stopped or key in self._pending:
+                return
+            if len(self._pending) >= self.max_pending:
+                return
+            self._pending[key] = None
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='webhdfs-revalidate', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                (kind, path), _ = self._pending.popitem(last=False)
+            try:
+                self._refresh(kind, path)
+            except Exception as e:
+                logger.warning("Can't revalidate %s %s: %s", kind, path, e)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._pending.clear()
+            self._cond.notify_all()
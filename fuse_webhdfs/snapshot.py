@@ -0,0 +1,81 @@
+import logging
+import os
+import sqlite3
+import time
+
+logger = logging.getLogger('Webhdfs')
+
+SCHEMA_VERSION = 2
+
+
+def save_snapshot(filename, metadata, stat_class):
+    """
+    Write the file statuses and directory listings of the metadata cache
+    to an SQLite file, replacing the previous snapshot atomically. Every
+    entry is saved with its age, so that entries loaded from a snapshot and
+    saved again without being refreshed keep getting older.
+    """
+    fields = stat_class.__slots__
+    tmp_filename = filename + '.tmp'
+    if os.path.exists(tmp_filename):
+        os.unlink(tmp_filename)
+    db = sqlite3.connect(tmp_filename)
+    try:
+        db.execute("CREATE TABLE info (version INTEGER, saved_at REAL)")
+        db.execute("INSERT INTO info VALUES (?, ?)",
+                   (SCHEMA_VERSION, time.time()))
+        db.execute("CREATE TABLE stats (path TEXT PRIMARY KEY, age REAL, {})".format(
+            ', '.join(fields)))
+        db.executemany(
+            "INSERT OR REPLACE INTO stats VALUES (?, ?, {})".format(
+                ', '.join('?' * len(fields))),
+            ((path, age) + tuple(getattr(st, field) for field in fields)
+             for path, st, age in metadata.stats.items()))
+        db.execute("CREATE TABLE listdirs (path TEXT PRIMARY KEY, age REAL, names TEXT)")
+        db.executemany(
+            "INSERT OR REPLACE INTO listdirs VALUES (?, ?, ?)",
+            ((path, age, '\0'.join(names))
+             for path, names, age in metadata.listdirs.items()))
+        db.commit()
+    finally:
+        db.close()
+    os.replace(tmp_filename, filename)
+
+
+def load_snapshot(filename, metadata, stat_class, max_stale):
+    """
+    Load a snapshot written by save_snapshot into the metadata cache.
+    The entries are loaded as stale, to be used only until they are
+    revalidated, and at most until they are max_stale seconds old.
+    Returns the paths of the loaded directory listings.
+    """
+    if not os.path.exists(filename):
+        return []
+    db = sqlite3.connect(filename)
+    try:
+        version, saved_at = db.execute(
+            "SELECT version, saved_at FROM info").fetchone()
+        elapsed = time.time() - saved_at
+        if version != SCHEMA_VERSION or elapsed >= max_stale:
+            logger.info("Ignoring outdated metadata snapshot %s", filename)
+            return []
+        fields = stat_class.__slots__
+        for row in db.execute("SELECT path, age, {} FROM stats WHERE age < ?".format(
+                ', '.join(fields)), (max_stale - elapsed,)):
+            metadata.stats.store_aged(row[0], stat_class(*row[2:]), row[1] + elapsed,
+                                      max_stale)
+        listdirs = []
+        for path, age, names in db.execute(
+                "SELECT path, age, names FROM listdirs WHERE age < ?", (max_stale - elapsed,)):
+            metadata.listdirs.store_aged(
+                path, dict.fromkeys(names.split('\0')) if names else {}, age + elapsed,
+                max_stale)
+            listdirs.append(path)
+    except sqlite3.Error as e:
+        logger.warning("Can't load metadata snapshot %s: %s", filename, e)
+        return []
+    finally:
+        db.close()
+    logger.info("Loaded metadata snapshot %s: %d stats, %d listings",
+                filename, len(metadata.stats), len(listdirs))
+    return listdirs
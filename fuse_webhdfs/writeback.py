@@ -0,0 +1,133 @@
+import queue
+import threading
+
+
+class WriteBuffer(object):
+    """
+    Accumulates the data appended to a file through FUSE writes, so that it
+    can be sent to HDFS with a single request instead of one per write.
+
+    size is the logical size of the file, including the buffered data.
+    permission is set for files created through the mount which haven't been
+    flushed yet: their first flush is a CREATE rather than an APPEND.
+    """
+
+    def __init__(self, size, max_bytes, permission=None):
+        self.size = size
+        self.max_bytes = max_bytes
+        self.permission = permission
+        self.lock = threading.Lock()
+        self._chunks = []
+        self._buffered = 0
+
+    @property
+    def buffered(self):
+        return self._buffered
+
+    @property
+    def full(self):
+        return self._buffered >= self.max_bytes
+
+    def append(self, data):
+        if data:
+            self._chunks.append(data)
+            self._buffered += len(data)
+            self.size += len(data)
+
+    def data(self):
+        if len(self._chunks) > 1:
+            self._chunks = [b''.join(self._chunks)]
+        return self._chunks[0] if self._chunks else b''
+
+    def clear(self):
+        self._chunks = []
+        self._buffered = 0
+        self.permission = None
+
+
+class UploadAborted(Exception):
+    pass
+
+
+class StreamingUpload(object):
+    """
+    Feeds the data written to a file into one long-lived streaming upload
+    running in a background thread, so that a file of any size is sent with
+    a single request while at most max_chunks writes are held in memory.
+
+    upload is called with an iterator of the written chunks, e.g.
+    lambda chunks: client.stream_create_file(path, chunks).
+    """
+
+    full = False
+    buffered = 0
+
+    def __init__(self, upload, max_chunks=16):
+        self.size = 0
+        self.finished = False
+        self.lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_chunks)
+        self._error = None
+        self._aborted = False
+        self._thread = threading.Thread(target=self._run, args=(upload,),
+                                        daemon=True)
+        self._thread.start()
+
+    def _run(self, upload):
+        try:
+            upload(self._chunks())
+        except Exception as e:
+            self._error = e
+
+    def _chunks(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                if self._aborted:
+                    raise UploadAborted()
+                return
+            yield chunk
+
+    def _put(self, item):
+        # Don't block forever on a full queue if the upload has died
+        while self._thread.is_alive():
+            try:
+                self._queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                pass
+        if self._error is not None:
+            raise self._error
+
+    def append(self, data):
+        if self._error is not None:
+            raise self._error
+        if data:
+            self._put(data)
+            self.size += len(data)
+
+    def finish(self):
+        """
+        Close the upload stream and wait for HDFS to acknowledge it
+        """
+        if self.finished:
+            return
+        self.finished = True
+        self._put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def abort(self):
+        """
+        Break off the upload, e.g. because the file has been deleted
+        """
+        if self.finished:
+            return
+        self.finished = True
+        self._aborted = True
+        try:
+            self._put(None)
+        except Exception:
+            pass
+        self._thread.join()
@@ -4,103 +4,588 @@ import webhdfs
 import pywebhdfs.errors
 
 import os
+import signal
 import sys
+import json
 import logging
+import random
+import threading
+import time
 from config.webhdfs import commandline_parser, configure
-from datetime import datetime
-from errno import EACCES, ENOENT, ENOTSUP, ENOSPC
-from fuse import FUSE, FuseOSError, Operations, LoggingMixIn
+from fuse_webhdfs.asynclog import SAMPLED, AsyncLogWriter, LogSummary
+from fuse_webhdfs.blockcache import BlockCache, ReadaheadDetector
+from fuse_webhdfs.diskcache import DiskBlockCache
+from fuse_webhdfs.metacache import MetadataCache, TTLCache, join_path, split_path
+from fuse_webhdfs.metrics import Metrics, MetricsServer
+from fuse_webhdfs.prefetch import DirectoryPrefetcher
+from fuse_webhdfs.profiler import SamplingProfiler, SlowOperationTracker
+from fuse_webhdfs.revalidate import Revalidator
+from fuse_webhdfs.snapshot import load_snapshot, save_snapshot
+from fuse_webhdfs.writeback import StreamingUpload, WriteBuffer
+from errno import EACCES, ENODATA, ENOENT, ENOTSUP, ENOSPC, errorcode
+from fuse import FUSE, FuseOSError, Operations
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.SecurityWarning)
 
 sys.path.insert(0, ".")
 
 logger = logging.getLogger('Webhdfs')
-CACHE_MAX_SECONDS = 30
+# Every file system operation is logged at debug level
+operations_logger = logging.getLogger('Webhdfs.operations')
 
+STATFS_BLOCK_SIZE = 4096
+# Reported as free space when the namenode reports neither the cluster
+# capacity nor a space quota, like other network file systems do
+UNKNOWN_FREE_SPACE = 1 << 50
+# The quota of directories without one, e.g. the namespace quota of the root
+HDFS_NO_QUOTA = (1 << 63) - 1
+HDFS_MAX_NAME_LENGTH = 255
+# Starts profiling the mount if --profile-dir is given
+PROFILE_SIGNAL = signal.SIGUSR2
 
-class WebHDFS(LoggingMixIn, Operations):
+# Virtual extended attributes with the content summary of a directory,
+# e.g. getfattr -n user.hdfs.space_consumed <dir>. Like CephFS does for its
+# recursive statistics, they are not listed by listxattr, so that tools
+# copying extended attributes don't fetch them for every directory.
+CONTENT_SUMMARY_XATTR = 'user.hdfs.content_summary'
+CONTENT_SUMMARY_XATTRS = {
+    'user.hdfs.length': 'length',
+    'user.hdfs.file_count': 'fileCount',
+    'user.hdfs.directory_count': 'directoryCount',
+    'user.hdfs.space_consumed': 'spaceConsumed',
+    'user.hdfs.quota': 'quota',
+    'user.hdfs.space_quota': 'spaceQuota',
+}
+
+
+class WebHDFS(Operations):
     """
     A simple Webhdfs filesystem.
     """
 
-    def __init__(self, config):
+    def __init__(self, config, log_writer=None):
         self.client = webhdfs.webhdfs_connect(config)
-        self._stats_cache = {}
-        self._listdir_cache = {}
-        self._enoent_cache = {}
-
-    def _get_listdir(self, path):
-        logger.info("List dir %s", path)
-        if path in self._listdir_cache:
-            ts_delta = datetime.now() - self._listdir_cache[path][0]
-            if ts_delta.total_seconds() < CACHE_MAX_SECONDS:
-                entries = self._listdir_cache[path][1]
-                logger.debug("_get_listdir %s: cached value %s", path, entries)
-                return entries
-        entries = []
-        # logger.info("Listdir: %s", path)
-        for s in self.client.list_dir(path)["FileStatuses"]["FileStatus"]:
-            sd = webhdfs.webhdfs_entry_to_dict(s)
-            # logger.debug("webhdfs_entry_to_dict %s: %s --> %s", sd['name'], s, sd)
-            logger.debug(
-                "Updating self._stats_cache[%s]", os.path.join(path, sd['name']))
-            self._stats_cache[path + '/' + sd['name']] = (datetime.now(), sd)
-            entries.append(sd['name'])
-        self._listdir_cache[path] = (datetime.now(), entries)
-        logger.debug("_get_listdir %s: new value %s", path, entries)
-        return entries
+        self._metadata = MetadataCache(stat_ttl=config.stat_ttl,
+                                       listdir_ttl=config.listdir_ttl,
+                                       enoent_ttl=config.enoent_ttl,
+                                       max_entries=config.metadata_cache_entries,
+                                       max_stale=config.max_stale,
+                                       summary_ttl=config.summary_ttl)
+        self._revalidator = Revalidator(self._refresh)
+        self._metadata_snapshot = config.metadata_snapshot
+        self._snapshot_listdirs = []
+        if self._metadata_snapshot:
+            self._snapshot_listdirs = load_snapshot(self._metadata_snapshot, self._metadata,
+                                                    webhdfs.FileStat, config.snapshot_max_stale)
+        self._prefetcher = None
+        if config.prefetch_depth:
+            self._prefetcher = DirectoryPrefetcher(self._prefetch_listdir,
+                                                   max_depth=config.prefetch_depth,
+                                                   max_workers=config.prefetch_workers)
+        # The cached listings whose subdirectories have been handed to the
+        # prefetcher, as (id of the listing, depth) by path
+        self._scanned_listings = TTLCache(config.listdir_ttl, config.metadata_cache_entries)
+        self._block_cache = BlockCache(block_size=config.block_size * 1024 * 1024,
+                                       max_bytes=config.cache_size * 1024 * 1024)
+        self._readahead = ReadaheadDetector(max_blocks=config.readahead)
+        self._disk_cache = None
+        if config.disk_cache:
+            self._disk_cache = DiskBlockCache(config.disk_cache,
+                                              max_bytes=config.disk_cache_size * 1024 * 1024,
+                                              block_size=self._block_cache.block_size)
+        self._parallel_reads = config.parallel_reads
+        self._write_buffer_size = config.write_buffer_size * 1024 * 1024
+        self._stream_uploads = config.stream_uploads
+        self._write_buffers = {}
+        self._write_buffers_lock = threading.Lock()
+        self._metrics = None
+        self._metrics_server = None
+        if config.metrics_port:
+            self._metrics = Metrics()
+            self._metrics.add_collector(self._collect_cache_metrics)
+            self.client.metrics = self._metrics
+            self._metrics_server = MetricsServer(self._metrics, config.metrics_port)
+        # Started in init and stopped in destroy
+        self._log_writer = log_writer
+        self._log_operations = operations_logger.isEnabledFor(logging.DEBUG)
+        self._log_sample_rate = log_writer.sample_rate if log_writer is not None else 1
+        self._slow_ops = None
+        if config.slow_op_threshold:
+            self._slow_ops = SlowOperationTracker(config.slow_op_threshold, metrics=self._metrics)
+        self._profiler = None
+        if config.profile_dir:
+            self._profiler = SamplingProfiler(config.profile_dir, duration=config.profile_duration,
+                                              slow_ops=self._slow_ops)
+            # Before FUSE starts its threads
+            self._profiler.handle_signal(PROFILE_SIGNAL)
+
+    def __call__(self, op, *args):
+        if self._metrics is None and not self._log_operations and self._slow_ops is None:
+            return super().__call__(op, *args)
+        return self._instrumented_call(op, args)
+
+    def _instrumented_call(self, op, args):
+        """
+        Call the operation, timed if metrics are enabled, watched by the
+        slow operation tracker and logged with data buffers summarized by
+        their size if operations are logged. Operations are sampled as a
+        whole, call and result.
+        """
+        logged = self._log_operations and (self._log_sample_rate >= 1 or
+                                           random.random() < self._log_sample_rate)
+        if logged:
+            operations_logger.debug("-> %s %s", op, LogSummary(args), extra=SAMPLED)
+        if self._slow_ops is not None:
+            self._slow_ops.begin(op, args)
+        start = time.monotonic()
+        try:
+            result = super().__call__(op, *args)
+        except Exception as e:
+            if self._slow_ops is not None:
+                self._slow_ops.end()
+            if logged:
+                operations_logger.debug("<- %s %r", op, e, extra=SAMPLED)
+            if self._metrics is not None:
+                if isinstance(e, FuseOSError):
+                    error = errorcode.get(e.errno, e.errno)
+                else:
+                    error = type(e).__name__
+                self._metrics.inc('webhdfs_fuse_errors_total', op=op, error=error)
+                self._metrics.observe('webhdfs_fuse_operation_seconds',
+                                      time.monotonic() - start, op=op)
+            raise
+        if op == 'readdir':
+            # Timed and logged once FUSE has consumed the listing
+            return self._instrumented_readdir(result, start, logged)
+        if self._slow_ops is not None:
+            self._slow_ops.end()
+        if logged:
+            operations_logger.debug("<- %s %s", op, LogSummary(result), extra=SAMPLED)
+        if self._metrics is not None:
+            if op == 'read':
+                self._metrics.inc('webhdfs_fuse_bytes_total', len(result), op=op)
+            elif op == 'write':
+                self._metrics.inc('webhdfs_fuse_bytes_total', result, op=op)
+            self._metrics.observe('webhdfs_fuse_operation_seconds',
+                                  time.monotonic() - start, op=op)
+        return result
+
+    def _instrumented_readdir(self, entries, start, logged):
+        count = 0
+        try:
+            for entry in entries:
+                count += 1
+                yield entry
+        finally:
+            if self._slow_ops is not None:
+                self._slow_ops.end()
+            if logged:
+                operations_logger.debug("<- readdir %d entries", count, extra=SAMPLED)
+            if self._metrics is not None:
+                self._metrics.observe('webhdfs_fuse_operation_seconds',
+                                      time.monotonic() - start, op='readdir')
+
+    def _collect_cache_metrics(self):
+        caches = [('block', self._block_cache),
+                  ('stat', self._metadata.stats),
+                  ('listdir', self._metadata.listdirs),
+                  ('enoent', self._metadata.enoent),
+                  ('summary', self._metadata.summaries)]
+        if self._disk_cache is not None:
+            caches.append(('disk', self._disk_cache))
+        for name, cache in caches:
+            labels = dict(cache=name)
+            yield 'webhdfs_cache_hits_total', 'counter', labels, cache.hits
+            yield 'webhdfs_cache_misses_total', 'counter', labels, cache.misses
+            yield 'webhdfs_cache_evictions_total', 'counter', labels, cache.evictions
+            if name in ('block', 'disk'):
+                yield 'webhdfs_cache_bytes', 'gauge', labels, cache.cached_bytes
+            else:
+                yield 'webhdfs_cache_entries', 'gauge', labels, len(cache)
+        yield 'webhdfs_open_write_buffers', 'gauge', {}, len(self._write_buffers)
+        connection_stats = self.client.connection_stats()
+        yield 'webhdfs_http_connections_total', 'counter', {}, connection_stats['connections']
+        yield 'webhdfs_http_requests_total', 'counter', {}, connection_stats['requests']
+
+    def _iter_listdir(self, path, use_cache=True, depth=0):
+        """
+        Iterate over the names of the directory entries. Uncached listings
+        are fetched page by page and every page is put into the stats cache
+        as soon as it arrives. The full listing is cached only if it fits
+        into the metadata cache. Once a listing is fetched, its
+        subdirectories are handed to the prefetcher, depth being how far
+        below the directory listed by the user this one is. Subdirectories
+        of cached listings are handed to the prefetcher as well, so that
+        a walk keeps being prefetched ahead below the cached levels.
+        """
+        logger.debug("List dir %s", path)
+        if use_cache:
+            if self._prefetcher is not None:
+                self._prefetcher.wait(path)
+            entries, fresh = self._metadata.listdirs.lookup(path)
+            if entries is not None:
+                logger.debug("_iter_listdir %s: cached value", path)
+                if not fresh:
+                    self._revalidator.submit('listdir', path)
+                yield from entries
+                # Only once the names are returned
+                if self._claim_subdir_scan(path, entries, depth):
+                    self._scan_cached_subdirs(path, entries, depth)
+                return
+        entries = {}
+        subdirs = []
+        max_entries = self._metadata.stats.max_entries
+        generation = self._metadata.generation()
+        for name, st in self.client.iter_list_dir(
+                path, file_status_hook=webhdfs.webhdfs_entry_to_named_stat):
+            entry_path = join_path(path, name)
+            self._metadata.put_stat(entry_path, st, generation)
+            if st.is_dir:
+                subdirs.append(entry_path)
+            if entries is not None:
+                entries[name] = None
+                if len(entries) > max_entries:
+                    entries = None
+            yield name
+        if entries is not None:
+            self._metadata.put_listing(path, entries, generation)
+        if self._prefetcher is not None and subdirs:
+            self._prefetcher.prefetch(subdirs, depth + 1)
+
+    def _prefetch_listdir(self, path, depth):
+        """
+        List a directory for the prefetcher, unless it is already cached
+        """
+        names = self._metadata.listdirs.peek(path)
+        if names is not None:
+            if self._claim_subdir_scan(path, names, depth):
+                self._scan_cached_subdirs(path, names, depth)
+            return
+        for _ in self._iter_listdir(path, use_cache=False, depth=depth):
+            pass
+
+    def _claim_subdir_scan(self, path, names, depth):
+        """
+        Whether the subdirectories of the cached listing are to be handed to
+        the prefetcher. They aren't if they already were, for the same
+        listing at the same depth or above, so that repeatedly listing a
+        cached directory doesn't scan it every time.
+        """
+        if self._prefetcher is None or depth >= self._prefetcher.max_depth:
+            return False
+        scanned = self._scanned_listings.peek(path)
+        if scanned is not None and scanned[0] == id(names) and scanned[1] <= depth:
+            return False
+        self._scanned_listings.put(path, (id(names), depth))
+        return True
+
+    def _scan_cached_subdirs(self, path, names, depth):
+        """
+        Hand the subdirectories of a cached listing to the prefetcher,
+        those whose status is cached at least
+        """
+        subdirs = []
+        for name in names:
+            entry_path = join_path(path, name)
+            st = self._metadata.stats.peek(entry_path)
+            if st is not None and st.is_dir:
+                subdirs.append(entry_path)
+        if not self._prefetcher.prefetch(subdirs, depth + 1):
+            # Some are left out, to be scanned for again
+            self._scanned_listings.pop(path)
 
     def _get_status(self, path):
         logger.debug("_get_dir_status %s", path)
-        if path in self._stats_cache:
-            ts_delta = datetime.now() - self._stats_cache[path][0]
-            if ts_delta.total_seconds() < CACHE_MAX_SECONDS:
-                sd = self._stats_cache[path][1]
-                logger.debug(
-                    "_get_status: path %s --> cached status %s", path, sd)
-                return sd
-        # logger.info("get_file_dir_status: %s", path)
-        s = self.client.get_file_dir_status(path)["FileStatus"]
-        sd = webhdfs.webhdfs_entry_to_dict(s)
-        logger.debug("_get_status: path %s --> new status %s", path, sd)
-        self._stats_cache[path] = (datetime.now(), sd)
-        return sd
+        st, fresh = self._metadata.stats.lookup(path)
+        if st is not None:
+            if not fresh:
+                # Re-listing the parent directory refreshes all of its entries at once
+                parent = split_path(path)[0]
+                if parent in self._metadata.listdirs:
+                    self._revalidator.submit('listdir', parent)
+                else:
+                    self._revalidator.submit('stat', path)
+            return st
+        return self._fetch_status(path)
+
+    def _get_fresh_status(self, path):
+        """
+        The status of the path, fetched again if the cached one is stale,
+        e.g. loaded from the metadata snapshot. Reads need it, since the
+        modification time and size are the version of the cached blocks.
+        """
+        st = self._metadata.stats.get(path)
+        if st is None:
+            st = self._fetch_status(path)
+        return st
+
+    def _fetch_status(self, path):
+        generation = self._metadata.generation()
+        st = self.client.get_file_dir_status(
+            path, file_status_hook=webhdfs.webhdfs_entry_to_stat)["FileStatus"]
+        self._metadata.put_stat(path, st, generation)
+        return st
+
+    def _get_content_summary(self, path):
+        summary = self._metadata.summaries.get(path)
+        if summary is None:
+            summary = self.client.get_content_summary(path)["ContentSummary"]
+            self._metadata.summaries.put(path, summary)
+        return summary
+
+    def _get_fs_usage(self):
+        """
+        The capacity, used and free bytes and the maximum and free number
+        of files of the cluster, from its capacity and usage if the namenode
+        reports them, else from the quotas of the root directory. Whatever
+        the namenode can't tell, or refuses to, is reported as unknown.
+        """
+        usage = self._metadata.summaries.get(None)
+        if usage is not None:
+            return usage
+        usage = dict(capacity=UNKNOWN_FREE_SPACE, used=0, free=UNKNOWN_FREE_SPACE,
+                     files=0, free_files=0)
+        try:
+            fs_status = self.client.get_fs_status()
+            if fs_status:
+                fs_status = fs_status["FsStatus"]
+                usage.update(capacity=fs_status["capacity"], used=fs_status["used"],
+                             free=fs_status["remaining"])
+            else:
+                # The root directory always has a quota, so unlike its
+                # content summary its quota usage is known without walking
+                # the whole namespace
+                quota_usage = self.client.get_quota_usage('/')
+                if quota_usage:
+                    self._update_quota_usage(usage, quota_usage["QuotaUsage"])
+        except pywebhdfs.errors.PyWebHdfsException as e:
+            logger.warning("Can't get the file system usage: %s", e)
+        self._metadata.summaries.put(None, usage)
+        return usage
+
+    @staticmethod
+    def _update_quota_usage(usage, quota_usage):
+        used = quota_usage["spaceConsumed"]
+        usage['used'] = used
+        if 0 <= quota_usage["spaceQuota"] < HDFS_NO_QUOTA:
+            usage['capacity'] = quota_usage["spaceQuota"]
+            usage['free'] = max(0, usage['capacity'] - used)
+        else:
+            usage['capacity'] = used + UNKNOWN_FREE_SPACE
+        if 0 <= quota_usage["quota"] < HDFS_NO_QUOTA:
+            usage['files'] = quota_usage["quota"]
+            usage['free_files'] = max(0, usage['files'] - quota_usage["fileAndDirectoryCount"])
+
+    def _refresh(self, kind, path):
+        """
+        Refresh a stale metadata cache entry, called by the revalidator
+        """
+        try:
+            if kind == 'listdir':
+                for _ in self._iter_listdir(path, use_cache=False):
+                    pass
+            else:
+                self._fetch_status(path)
+        except pywebhdfs.errors.FileNotFound:
+            self._metadata.invalidate(path)
+            self._metadata.invalidate_listing(path)
+            self._metadata.enoent.put(path, True)
 
     def _flush_file_info(self, path):
-        if path in self._stats_cache:
-            del self._stats_cache[path]
-        if path in self._enoent_cache:
-            del self._enoent_cache[path]
-        dirname = os.path.dirname(path)
-        if dirname in self._listdir_cache:
-            del self._listdir_cache[dirname]
+        self._metadata.invalidate(path)
+        self._block_cache.invalidate(path)
+        self._readahead.forget(path)
+
+    def _fetch_blocks(self, path, first, last, version):
+        """
+        Fetch blocks first..last (inclusive) of the file and store them in
+        the block cache as read-only memoryviews. Blocks at the tail of the
+        range which are already cached are not fetched again.
+        """
+        block_size = self._block_cache.block_size
+        file_size = version[1]
+        last = min(last, (file_size - 1) // block_size)
+        while last > first and self._block_cache.get(path, last, version) is not None:
+            last -= 1
+        offset = first * block_size
+        end = min((last + 1) * block_size, file_size)
+        logger.debug("Fetching blocks %d..%d of %s", first, last, path)
+        # The data is read from the connection straight into the block buffers
+        buffers = [bytearray(min(block_size, end - start))
+                   for start in range(offset, end, block_size)]
+        if len(buffers) > 1 and self._parallel_reads > 1:
+            received = self.client.read_file_parallel_into(
+                path, list(zip(range(offset, end, block_size), buffers)),
+                max_workers=self._parallel_reads)
+        else:
+            remaining = self.client.read_file_into(path, buffers, offset=offset)
+            received = []
+            for buf in buffers:
+                received.append(min(len(buf), remaining))
+                remaining -= received[-1]
+        blocks = []
+        for buf, size in zip(buffers, received):
+            if size < len(buf):
+                # The file is shorter than it was
+                del buf[size:]
+            if buf:
+                blocks.append(memoryview(buf).toreadonly())
+            if size < block_size:
+                break
+        # Insert the blocks needed first last, so that they are the least
+        # likely to be evicted by their own readahead
+        for index, block in reversed(list(enumerate(blocks, first))):
+            self._block_cache.put(path, index, version, block)
+        if self._disk_cache is not None:
+            for index, block in enumerate(blocks, first):
+                self._disk_cache.put_async(path, index, version, block)
+        return blocks
+
+    def _get_block(self, path, index, version):
+        block = self._block_cache.get(path, index, version)
+        if block is None and self._disk_cache is not None:
+            block = self._disk_cache.get(path, index, version)
+            if block is not None:
+                self._block_cache.put(path, index, version, block)
+        return block
+
+    def _get_write_buffer(self, path):
+        with self._write_buffers_lock:
+            buf = self._write_buffers.get(path)
+            if isinstance(buf, StreamingUpload) and buf.finished:
+                # Once a streaming upload has been flushed the file
+                # can only be appended to
+                buf = self._write_buffers[path] = WriteBuffer(
+                    buf.size, self._write_buffer_size)
+        if buf is not None:
+            return buf
+        size = self._get_status(path).st_size
+        with self._write_buffers_lock:
+            return self._write_buffers.setdefault(
+                path, WriteBuffer(size, self._write_buffer_size))
+
+    def _flush_write_buffer(self, path, buf):
+        """
+        Send the buffered data of the file to HDFS. Must be called
+        with buf.lock held.
+        """
+        if isinstance(buf, StreamingUpload):
+            logger.info("Finishing upload of %s (file size %d)", path, buf.size)
+            buf.finish()
+            self._flush_file_info(path)
+            return
+        if not buf.buffered:
+            return
+        data = buf.data()
+        logger.info("Flushing %d bytes to %s (file size %d)", len(data), path, buf.size)
+        if buf.permission is not None:
+            self.client.create_file(path, file_data=data,
+                                    overwrite=True, permission=buf.permission)
+        else:
+            self.client.append_file(path, file_data=data)
+        buf.clear()
+        self._flush_file_info(path)
+
+    def _sync(self, path, release=False):
+        with self._write_buffers_lock:
+            buf = self._write_buffers.get(path)
+        if buf is None:
+            return
+        try:
+            with buf.lock:
+                self._flush_write_buffer(path, buf)
+        except Exception:
+            if release:
+                # The data is lost: drop the buffer rather than keep reporting
+                # its size, and get the actual file status from HDFS again
+                self._flush_file_info(path)
+            raise
+        finally:
+            if release:
+                with self._write_buffers_lock:
+                    if self._write_buffers.get(path) is buf:
+                        del self._write_buffers[path]
 
     def getattr(self, path, fh=None):
-        if path in self._enoent_cache:
-            ts_delta = datetime.now() - self._enoent_cache[path]
-            if ts_delta.total_seconds() < CACHE_MAX_SECONDS:
-                raise FuseOSError(ENOENT)
-            else:
-                del self._enoent_cache[path]
+        if self._metadata.is_missing(path):
+            raise FuseOSError(ENOENT)
         try:
             st = self._get_status(path)
-            return st
+            with self._write_buffers_lock:
+                buf = self._write_buffers.get(path)
+            if buf is not None:
+                return st.to_dict(st_size=buf.size)
+            return st.to_dict()
         except pywebhdfs.errors.FileNotFound:
-            self._enoent_cache[path] = datetime.now()
+            self._metadata.enoent.put(path, True)
             raise FuseOSError(ENOENT)
 
+    def statfs(self, path):
+        usage = self._get_fs_usage()
+        return dict(f_bsize=STATFS_BLOCK_SIZE, f_frsize=STATFS_BLOCK_SIZE,
+                    f_blocks=usage['capacity'] // STATFS_BLOCK_SIZE,
+                    f_bfree=usage['free'] // STATFS_BLOCK_SIZE,
+                    f_bavail=usage['free'] // STATFS_BLOCK_SIZE,
+                    f_files=usage['files'], f_ffree=usage['free_files'],
+                    f_favail=usage['free_files'],
+                    f_namemax=HDFS_MAX_NAME_LENGTH)
+
+    def getxattr(self, path, name, position=0):
+        if name != CONTENT_SUMMARY_XATTR and name not in CONTENT_SUMMARY_XATTRS:
+            raise FuseOSError(ENODATA)
+        try:
+            summary = self._get_content_summary(path)
+        except pywebhdfs.errors.FileNotFound:
+            raise FuseOSError(ENOENT)
+        if name == CONTENT_SUMMARY_XATTR:
+            return json.dumps(summary, sort_keys=True).encode('utf8')
+        return str(summary[CONTENT_SUMMARY_XATTRS[name]]).encode('utf8')
+
     def readdir(self, path, fh):
-        return [u'.', u'..'] + self._get_listdir(path)
+        yield u'.'
+        yield u'..'
+        yield from self._iter_listdir(path)
 
     def read(self, path, size, offset, fh):
-        logger.info("read: path %s size %d offset %d", path, size, offset)
-        if offset >= self._get_status(path)['st_size']:
+        self._sync(path)
+        st = self._get_fresh_status(path)
+        file_size = st.st_size
+        if offset >= file_size:
             data = b''
-        else:
+        elif not self._block_cache.capacity and self._disk_cache is None:
             data = self.client.read_file(
                 path, length=size, offset=offset)[:size]
-        logger.info("read: path %s result size %d", path, len(data))
+        else:
+            size = min(size, file_size - offset)
+            version = (st.st_mtime, file_size)
+            block_size = self._block_cache.block_size
+            first = offset // block_size
+            last = (offset + size - 1) // block_size
+            readahead = min(self._readahead.update(path, offset, size),
+                            self._block_cache.capacity // 2)
+            blocks = []
+            index = first
+            while index <= last:
+                block = self._get_block(path, index, version)
+                if block is not None:
+                    blocks.append(block)
+                    index += 1
+                    continue
+                fetched = self._fetch_blocks(path, index, last + readahead, version)
+                if not fetched:
+                    break
+                blocks.extend(fetched[:last - index + 1])
+                index += len(fetched)
+            # Join slices of the cached blocks, so that the data is only
+            # copied once into the bytes object handed to FUSE
+            start = offset - first * block_size
+            pieces = []
+            for block in blocks:
+                piece = block[start:start + size]
+                pieces.append(piece)
+                size -= len(piece)
+                start = 0
+            data = b''.join(pieces)
         return data
 
     def mkdir(self, path, mode):
@@ -116,35 +601,100 @@ class WebHDFS(LoggingMixIn, Operations):
         self.client.create_file(path, file_data=None,
                                 overwrite=True, permission=perm)
         self._flush_file_info(path)
+        # The data written to the new file is sent with a single CREATE
+        # replacing the empty file, either streamed as it is written or
+        # on the first flush
+        if self._stream_uploads:
+            buf = StreamingUpload(lambda chunks: self.client.stream_create_file(
+                path, chunks, overwrite=True, permission=perm))
+        else:
+            buf = WriteBuffer(0, self._write_buffer_size, permission=perm)
+        with self._write_buffers_lock:
+            self._write_buffers[path] = buf
         return 0
 
     def write(self, path, data, offset, fh):
-        st = self._get_status(path)
-        logger.info("Writing to %s size %d at offset %d (file size %d)",
-                    path, len(data), offset, st['st_size'])
-        if offset + len(data) < st['st_size']:
-            logger.warning("Can't write in the middle of the file %s. "
-                           "Tried to write %d bytes at offset %d < file size %d",
-                           path, len(data), offset, st['st_size'])
-            raise FuseOSError(ENOTSUP)
-        if offset > st['st_size']:
-            logger.warning(
-                "Can't write to %s at offset %d > file size %d", path, offset, st['st_size'])
-            raise FuseOSError(ENOTSUP)
-        data_sub = data[st['st_size'] - offset:]
-        # logger.info("Writing %s: %d bytes at offsets %d..%d",
-        #             path, len(data_sub), st['st_size'], st['st_size']+len(data_sub))
-        self.client.append_file(path, file_data=data_sub, overwrite=True)
-        self._flush_file_info(path)
+        buf = self._get_write_buffer(path)
+        with buf.lock:
+            size = buf.size
+            logger.debug("Writing to %s size %d at offset %d (file size %d)",
+                         path, len(data), offset, size)
+            if offset + len(data) < size:
+                logger.warning("Can't write in the middle of the file %s. "
+                               "Tried to write %d bytes at offset %d < file size %d",
+                               path, len(data), offset, size)
+                raise FuseOSError(ENOTSUP)
+            if offset > size:
+                logger.warning(
+                    "Can't write to %s at offset %d > file size %d", path, offset, size)
+                raise FuseOSError(ENOTSUP)
+            buf.append(data[size - offset:])
+            if buf.full:
+                self._flush_write_buffer(path, buf)
         return len(data)
 
+    def flush(self, path, fh):
+        self._sync(path)
+        return 0
+
+    def fsync(self, path, datasync, fh):
+        self._sync(path)
+        return 0
+
+    def release(self, path, fh):
+        self._sync(path, release=True)
+        return 0
+
     def unlink(self, path):
         logger.info("Unlink %s", path)
+        with self._write_buffers_lock:
+            buf = self._write_buffers.pop(path, None)
+        if isinstance(buf, StreamingUpload):
+            buf.abort()
         self.client.delete_file_dir(path)
         self._flush_file_info(path)
         return 0
 
+    def init(self, path):
+        if self._log_writer is not None:
+            self._log_writer.start()
+        # Connect to the active namenode before the first operation needs it,
+        # which also caches the root directory
+        try:
+            self._fetch_status('/')
+        except Exception as e:
+            logger.warning("Can't connect to the namenode: %s", e)
+        # Threads may only be started now that FUSE has daemonized
+        for listdir_path in self._snapshot_listdirs:
+            self._revalidator.submit('listdir', listdir_path)
+        self._snapshot_listdirs = []
+        if self._metrics_server is not None:
+            self._metrics_server.start()
+        if self._slow_ops is not None:
+            self._slow_ops.start()
+        if self._profiler is not None:
+            self._profiler.watch_signal(PROFILE_SIGNAL)
+
     def destroy(self, path):
+        if self._metrics_server is not None:
+            self._metrics_server.stop()
+        if self._slow_ops is not None:
+            self._slow_ops.stop()
+        self._revalidator.stop()
+        if self._prefetcher is not None:
+            self._prefetcher.stop()
+        if self._metadata_snapshot:
+            try:
+                save_snapshot(self._metadata_snapshot, self._metadata, webhdfs.FileStat)
+            except Exception as e:
+                logger.warning("Can't save metadata snapshot %s: %s", self._metadata_snapshot, e)
+        if self._disk_cache is not None:
+            self._disk_cache.flush()
+            logger.info("Disk cache statistics: %s", self._disk_cache.stats())
+        logger.info("Connection statistics: %s", self.client.connection_stats())
+        self.client.close()
+        if self._log_writer is not None:
+            self._log_writer.stop()
         return 0
 
     def chmod(self, path, mode):
@@ -177,6 +727,7 @@ class WebHDFS(LoggingMixIn, Operations):
         hdfs_path_old = old  # [len(mountpoint):]
         hdfs_path_new = os.path.join(os.path.dirname(hdfs_path_old), new)
         logger.info("Rename '%s' --> '%s'", hdfs_path_old, hdfs_path_new)
+        self._sync(old, release=True)
         res = self.client.rename_file_dir(hdfs_path_old, hdfs_path_new)
         if res.get('boolean', None):
             logger.info("Rename success")
@@ -210,8 +761,11 @@ if __name__ == '__main__':
     parser.add_argument('mountpoint', help='Mount directory')
 
     config = configure(parser)
-    logging.basicConfig(level=logging.INFO, filename=config.logfile)
+    # Without a log file only warnings and errors are logged, by default
+    log_level = config.log_level or ('info' if config.logfile else 'warning')
+    log_writer = AsyncLogWriter(level=log_level.upper(), filename=config.logfile,
+                                sample_rate=config.log_sample_rate)
     print("Mounting {} at {}".format(config.hdfs_baseurl, config.mountpoint))
 
-    fuse = FUSE(operations=WebHDFS(config), mountpoint=config.mountpoint, foreground=False,
-                nothreads=True, big_writes=True, max_read=1024*1024, max_write=1024*1024)
+    fuse = FUSE(operations=WebHDFS(config, log_writer=log_writer), mountpoint=config.mountpoint, foreground=False,
+                nothreads=not config.threads, big_writes=True, max_read=1024*1024, max_write=1024*1024)
@@ -0,0 +1,562 @@
+"""
+An asyncio WebHDFS client, with the same methods as PyWebHdfsClient as
+coroutines, so that hundreds of namenode and datanode requests can be in
+flight from one event loop instead of a thread each.
+
+It needs aiohttp (pip install fuse-webhdfs[async]):
+
+>>> async with AsyncPyWebHdfsClient(host='host', port='50070') as hdfs:
+>>>     statuses = await asyncio.gather(
+>>>         *(hdfs.get_file_dir_status(path) for path in paths))
+
+Synchronous code, like the FUSE file system, can run coroutines on a
+shared event loop in a background thread with AsyncBridge.
+"""
+import asyncio
+from collections import OrderedDict
+from http import HTTPStatus
+import threading
+
+from pywebhdfs import errors, operations
+from pywebhdfs.webhdfs import (PyWebHdfsClient, _loads_json,
+                               _is_standby_content, _is_unsupported_content,
+                               _move_active_host_to_head,
+                               _raise_pywebhdfs_exception, _rewrite_location,
+                               _split_range)
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class AsyncPyWebHdfsClient(object):
+    """
+    AsyncPyWebHdfsClient is an asyncio wrapper for the Hadoop WebHDFS REST
+    API, behaving like PyWebHdfsClient: the same federation and HA failover,
+    datanode redirect cache and FileStatus hooks.
+
+    To use this client:
+
+    >>> from pywebhdfs.aio import AsyncPyWebHdfsClient
+    """
+
+    def __init__(self, host='localhost', port='50070', user_name=None,
+                 path_to_hosts=None, timeout=120,
+                 base_uri_pattern="http://{host}:{port}/webhdfs/v1/",
+                 request_extra_opts={}, redirect_cache_ttl=0,
+                 redirect_block_size=128 * 1024 * 1024,
+                 redirect_cache_size=4096, max_connections=100,
+                 max_connections_per_host=0, keepalive_timeout=15):
+        """
+        Create a new client for interacting with WebHDFS
+
+        Takes the arguments of PyWebHdfsClient, except that
+        request_extra_opts are passed to aiohttp requests (e.g. ssl, auth,
+        params or proxy), plus:
+
+        :param max_connections: maximum number of open connections
+        :param max_connections_per_host: maximum number of open connections
+          to a single namenode or datanode (def: 0, no limit)
+        :param keepalive_timeout: number of seconds idle connections are
+          kept open for reuse
+
+        >>> hdfs = AsyncPyWebHdfsClient(host='host',port='50070',
+        >>>                             user_name='hdfs')
+        """
+        if aiohttp is None:
+            raise ImportError('aiohttp is needed for the asyncio client, '
+                              'pip install fuse-webhdfs[async]')
+
+        self.host = host
+        self.port = port
+        self.user_name = user_name
+        self.timeout = timeout
+        self.path_to_hosts = path_to_hosts
+        if self.path_to_hosts is None:
+            self.path_to_hosts = [('.*', [self.host])]
+
+        self.base_uri_pattern = base_uri_pattern.format(
+            host="{host}", port=port)
+        self.request_extra_opts = request_extra_opts
+        # See PyWebHdfsClient
+        self._federation = (None, [])
+        self._base_uris = (None, {})
+
+        self.redirect_cache_ttl = redirect_cache_ttl
+        self.redirect_block_size = redirect_block_size
+        self.redirect_cache_size = redirect_cache_size
+        self._redirect_cache = OrderedDict()
+        self._redirect_cache_lock = threading.Lock()
+        self._list_batch_supported = True
+
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self._session = None
+
+    @property
+    def session(self):
+        """
+        The aiohttp session and its connection pool, created in the running
+        event loop on first use
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_connections_per_host,
+                keepalive_timeout=self.keepalive_timeout)
+            # Like the timeout of requests, self.timeout limits connecting
+            # and every wait for data rather than the whole transfer, so
+            # that large reads and uploads aren't cut off
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=None,
+                                              sock_connect=self.timeout,
+                                              sock_read=self.timeout))
+        return self._session
+
+    async def close(self):
+        """
+        Close the session and its pooled connections
+        """
+        session, self._session = self._session, None
+        if session is not None:
+            await session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def create_file(self, path, file_data, **kwargs):
+        """
+        Creates a new file on HDFS, see PyWebHdfsClient.create_file
+
+        file_data may be bytes, a file like object or an async iterator of
+        bytes, which is sent with chunked transfer encoding.
+        """
+
+        init_response = await self._resolve_host('PUT', False,
+                                                 path, operations.CREATE,
+                                                 **kwargs)
+        if not init_response.status == HTTPStatus.TEMPORARY_REDIRECT:
+            _raise_pywebhdfs_exception(
+                init_response.status, await init_response.read())
+
+        uri = init_response.headers['location']
+        async with self.session.put(
+                uri, data=file_data,
+                headers={'content-type': 'application/octet-stream'},
+                **self.request_extra_opts) as response:
+            if not response.status == HTTPStatus.CREATED:
+                _raise_pywebhdfs_exception(response.status,
+                                           await response.read())
+
+        return True
+
+    async def append_file(self, path, file_data, **kwargs):
+        """
+        Appends to an existing file on HDFS, see PyWebHdfsClient.append_file
+        """
+
+        init_response = await self._resolve_host('POST', False,
+                                                 path, operations.APPEND,
+                                                 **kwargs)
+        if not init_response.status == HTTPStatus.TEMPORARY_REDIRECT:
+            _raise_pywebhdfs_exception(
+                init_response.status, await init_response.read())
+
+        uri = init_response.headers['location']
+        async with self.session.post(
+                uri, data=file_data,
+                headers={'content-type': 'application/octet-stream'},
+                **self.request_extra_opts) as response:
+            if not response.status == HTTPStatus.OK:
+                _raise_pywebhdfs_exception(response.status,
+                                           await response.read())
+
+        return True
+
+    async def stream_create_file(self, path, producer, chunk_size=1024 * 1024,
+                                 **kwargs):
+        """
+        Creates a new file on HDFS with data streamed from a producer: an
+        iterator or async iterator of bytes, or a file like object
+        """
+
+        return await self.create_file(
+            path, _aiter_chunks(producer, chunk_size), **kwargs)
+
+    async def stream_append_file(self, path, producer, chunk_size=1024 * 1024,
+                                 **kwargs):
+        """
+        Appends data streamed from a producer to an existing file on HDFS
+        """
+
+        return await self.append_file(
+            path, _aiter_chunks(producer, chunk_size), **kwargs)
+
+    async def read_file(self, path, **kwargs):
+        """
+        Reads from a file on HDFS and returns the content, see
+        PyWebHdfsClient.read_file
+        """
+
+        response = await self._open(path, **kwargs)
+        async with response:
+            if not response.status == HTTPStatus.OK:
+                _raise_pywebhdfs_exception(response.status,
+                                           await response.read())
+            return await response.read()
+
+    async def read_file_parallel(self, path, offset, length,
+                                 part_size=None, max_concurrency=4):
+        """
+        Reads a range of a file on HDFS with several concurrent requests,
+        see PyWebHdfsClient.read_file_parallel
+        """
+
+        ranges = _split_range(offset, length,
+                              part_size or self.redirect_block_size,
+                              self.redirect_block_size)
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def read_part(start, stop):
+            async with semaphore:
+                return await self.read_file(path, offset=start,
+                                            length=stop - start)
+
+        parts = await asyncio.gather(
+            *(read_part(start, stop) for start, stop in ranges))
+        buf = bytearray()
+        for (start, stop), part in zip(ranges, parts):
+            buf += part
+            if len(part) < stop - start:
+                # The file ended within this part
+                break
+        return buf
+
+    async def stream_file(self, path, chunk_size=1024, **kwargs):
+        """
+        Reads from a file on HDFS, yielding the content in chunks
+        of at most chunk_size bytes as it arrives
+
+        >>> async for chunk in hdfs.stream_file(my_file, 1024 * 1024):
+        >>>     out.write(chunk)
+        """
+
+        response = await self._open(path, **kwargs)
+        async with response:
+            if not response.status == HTTPStatus.OK:
+                _raise_pywebhdfs_exception(response.status,
+                                           await response.read())
+            async for chunk in response.content.iter_chunked(chunk_size):
+                yield chunk
+
+    async def make_dir(self, path, **kwargs):
+        """
+        Create a new directory on HDFS
+        """
+
+        response = await self._resolve_host('PUT', True,
+                                            path, operations.MKDIRS, **kwargs)
+        if not response.status == HTTPStatus.OK:
+            _raise_pywebhdfs_exception(response.status, await response.read())
+
+        return True
+
+    async def rename_file_dir(self, path, destination_path):
+        """
+        Rename an existing directory or file on HDFS
+        """
+
+        destination_path = '/' + destination_path.lstrip('/')
+
+        response = await self._resolve_host('PUT', True,
+                                            path, operations.RENAME,
+                                            destination=destination_path)
+        if not response.status == HTTPStatus.OK:
+            _raise_pywebhdfs_exception(response.status, await response.read())
+
+        return _loads_json(await response.read())
+
+    async def delete_file_dir(self, path, recursive=False):
+        """
+        Delete an existing file or directory from HDFS
+        """
+
+        response = await self._resolve_host('DELETE', True,
+                                            path, operations.DELETE,
+                                            recursive=recursive)
+        if not response.status == HTTPStatus.OK:
+            _raise_pywebhdfs_exception(response.status, await response.read())
+
+        return True
+
+    async def get_file_dir_status(self, path, file_status_hook=None):
+        """
+        Get the file_status of a single file or directory on HDFS
+        """
+
+        response = await self._resolve_host('GET', True,
+                                            path, operations.GETFILESTATUS)
+        if not response.status == HTTPStatus.OK:
+            _raise_pywebhdfs_exception(response.status, await response.read())
+
+        return _loads_json(await response.read(), file_status_hook)
+
+    async def get_content_summary(self, path):
+        """
+        Get the content summary of a directory on HDFS
+        """
+
+        response = await self._resolve_host('GET', True,
+                                            path, operations.GETCONTENTSUMMARY)
+        if not response.status == HTTPStatus.OK:
+            _raise_pywebhdfs_exception(response.status, await response.read())
+
+        return _loads_json(await response.read())
+
+    async def list_dir(self, path, file_status_hook=None):
+        """
+        Get a list of file_status for all files and directories
+        inside an HDFS directory
+        """
+
+        response = await self._resolve_host('GET', True,
+                                            path, operations.LISTSTATUS)
+        if not response.status == HTTPStatus.OK:
+            _raise_pywebhdfs_exception(response.status, await response.read())
+
+        return _loads_json(await response.read(), file_status_hook)
+
+    async def iter_list_dir(self, path, file_status_hook=None):
+        """
+        Iterate over the file_status of all files and directories inside an
+        HDFS directory, fetched page by page, see
+        PyWebHdfsClient.iter_list_dir
+
+        >>> async for file_status in hdfs.iter_list_dir(my_dir):
+        >>>     print(file_status['pathSuffix'])
+        """
+
+        last_path_suffix = [None]
+
+        def path_suffix_hook(file_status):
+            last_path_suffix[0] = file_status["pathSuffix"]
+            if file_status_hook is None:
+                return file_status
+            return file_status_hook(file_status)
+
+        start_after = None
+        while True:
+            if not self._list_batch_supported:
+                listing = await self.list_dir(path, file_status_hook)
+                for file_status in listing["FileStatuses"]["FileStatus"]:
+                    yield file_status
+                return
+            optional_args = {}
+            if start_after is not None:
+                optional_args['startAfter'] = start_after
+            response = await self._resolve_host('GET', True,
+                                                path,
+                                                operations.LISTSTATUS_BATCH,
+                                                **optional_args)
+            content = await response.read()
+            if start_after is None and _is_unsupported_content(
+                    response.status, content, operations.LISTSTATUS_BATCH):
+                self._list_batch_supported = False
+                continue
+            if not response.status == HTTPStatus.OK:
+                _raise_pywebhdfs_exception(response.status, content)
+
+            listing = _loads_json(
+                content, path_suffix_hook)["DirectoryListing"]
+            file_statuses = \
+                listing["partialListing"]["FileStatuses"]["FileStatus"]
+            for file_status in file_statuses:
+                yield file_status
+            if not listing["remainingEntries"] or not file_statuses:
+                return
+            start_after = last_path_suffix[0]
+
+    async def exists_file_dir(self, path):
+        """
+        Checks whether a file or directory exists on HDFS
+        """
+        response = await self._resolve_host('GET', True,
+                                            path, operations.GETFILESTATUS)
+        if response.status == HTTPStatus.OK:
+            return True
+        elif response.status == HTTPStatus.NOT_FOUND:
+            return False
+        _raise_pywebhdfs_exception(response.status, await response.read())
+
+    async def set_permission(self, path, permission):
+        """
+        Set permission of a file on HDFS
+        """
+
+        response = await self._resolve_host('PUT', False,
+                                            path, operations.SETPERMISSION,
+                                            permission=permission)
+        if not response.status == HTTPStatus.OK:
+            _raise_pywebhdfs_exception(response.status, await response.read())
+
+        return True
+
+    async def set_owner(self, path, owner, group):
+        """
+        Set owner of a file on HDFS
+        """
+
+        response = await self._resolve_host('PUT', False,
+                                            path, operations.SETOWNER,
+                                            owner=owner, group=group)
+        if not response.status == HTTPStatus.OK:
+            _raise_pywebhdfs_exception(response.status, await response.read())
+
+        return True
+
+    async def _open(self, path, **kwargs):
+        """
+        internal function used to make an OPEN request, following the
+        redirect to the datanode and caching its location like
+        PyWebHdfsClient._open. The body of the returned response is not read.
+        """
+        key = (path, int(kwargs.get('offset', 0)) // self.redirect_block_size)
+        location = self._get_cached_location(key)
+        if location is not None:
+            try:
+                response = await self.session.get(
+                    _rewrite_location(location, kwargs),
+                    **self.request_extra_opts)
+                if response.status == HTTPStatus.OK:
+                    return response
+                response.release()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                pass
+            self._forget_location(key)
+
+        response = await self._resolve_host('GET', False,
+                                            path, operations.OPEN, **kwargs)
+        if not response.status == HTTPStatus.TEMPORARY_REDIRECT:
+            return response
+
+        location = response.headers['location']
+        self._cache_location(key, location)
+        return await self.session.get(location, **self.request_extra_opts)
+
+    _get_cached_location = PyWebHdfsClient._get_cached_location
+    _cache_location = PyWebHdfsClient._cache_location
+    _forget_location = PyWebHdfsClient._forget_location
+    _create_uri_suffix = PyWebHdfsClient._create_uri_suffix
+    _base_uri = PyWebHdfsClient._base_uri
+    _resolve_federation = PyWebHdfsClient._resolve_federation
+
+    async def _resolve_host(self, method, allow_redirect,
+                            path, operation, **kwargs):
+        """
+        internal function used to resolve federation and HA and
+        return response of resolved host, with its body already read.
+        """
+        uri_suffix = self._create_uri_suffix(path, operation, **kwargs)
+        hosts = self._resolve_federation(path)
+        # Iterate over a copy, as concurrent requests reorder the hosts
+        for host in list(hosts):
+            uri = self._base_uri(host) + uri_suffix
+            try:
+                response = await self.session.request(
+                    method, uri, allow_redirects=allow_redirect,
+                    **self.request_extra_opts)
+                # Reading the whole body hands the connection back to the
+                # pool, and keeps the body for later reads
+                content = await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                continue
+
+            if not _is_standby_content(response.status, content):
+                _move_active_host_to_head(hosts, host)
+                return response
+        raise errors.ActiveHostNotFound(msg="Could not find active host")
+
+
+async def _aiter_chunks(producer, chunk_size):
+    """
+    turn a file like object, an iterator or an async iterator into an async
+    generator, which makes aiohttp send it with chunked transfer encoding
+    """
+    if hasattr(producer, 'read'):
+        while True:
+            chunk = producer.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    elif hasattr(producer, '__aiter__'):
+        async for chunk in producer:
+            if chunk:
+                yield chunk
+    else:
+        for chunk in producer:
+            if chunk:
+                yield chunk
+
+
+class AsyncBridge(object):
+    """
+    Runs coroutines of an AsyncPyWebHdfsClient from synchronous code, on an
+    event loop in a background thread shared by all callers.
+
+    The thread is started on first use, i.e. after FUSE has daemonized the
+    process.
+
+    >>> bridge = AsyncBridge(AsyncPyWebHdfsClient(host='host'))
+    >>> futures = [bridge.submit(bridge.client.list_dir, path)
+    >>>            for path in paths]
+    >>> listings = [future.result() for future in futures]
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _get_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name='webhdfs-asyncio',
+                    daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Schedule the coroutine func(*args, **kwargs) on the event loop and
+        return a concurrent.futures.Future of its result
+        """
+        return asyncio.run_coroutine_threadsafe(func(*args, **kwargs),
+                                                self._get_loop())
+
+    def run(self, func, *args, **kwargs):
+        """
+        Run the coroutine func(*args, **kwargs) and wait for its result
+        """
+        return self.submit(func, *args, **kwargs).result()
+
+    def close(self):
+        """
+        Close the client and stop the event loop
+        """
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.client.close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join()
+        loop.close()
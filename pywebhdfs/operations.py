@@ -6,11 +6,15 @@ RENAME = 'RENAME'
 DELETE = 'DELETE'
 GETFILESTATUS = 'GETFILESTATUS'
 LISTSTATUS = 'LISTSTATUS'
+LISTSTATUS_BATCH = 'LISTSTATUS_BATCH'
 GETFILECHECKSUM = 'GETFILECHECKSUM'
 GETCONTENTSUMMARY = 'GETCONTENTSUMMARY'
+GETSTATUS = 'GETSTATUS'
+GETQUOTAUSAGE = 'GETQUOTAUSAGE'
 GETXATTRS = 'GETXATTRS'
 LISTXATTRS = 'LISTXATTRS'
 REMOVEXATTR = 'REMOVEXATTR'
 SETXATTR = 'SETXATTR'
 SETPERMISSION = 'SETPERMISSION'
 SETOWNER = 'SETOWNER'
+SETTIMES = 'SETTIMES'
@@ -1,9 +1,22 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from http import HTTPStatus
+import json
 import re
+import socket
+import threading
+import time
 import requests
-from urllib.parse import quote, quote_plus
+from requests.adapters import HTTPAdapter
+from urllib.parse import (quote, quote_plus, urlsplit, urlunsplit,
+                          parse_qsl, urlencode)
 from pywebhdfs import errors, operations
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 class PyWebHdfsClient(object):
     """
@@ -17,7 +30,10 @@ class PyWebHdfsClient(object):
     def __init__(self, host='localhost', port='50070', user_name=None,
                  path_to_hosts=None, timeout=120,
                  base_uri_pattern="http://{host}:{port}/webhdfs/v1/",
-                 request_extra_opts={}):
+                 request_extra_opts={}, redirect_cache_ttl=0,
+                 redirect_block_size=128 * 1024 * 1024,
+                 redirect_cache_size=4096, metrics=None, pool_hosts=256,
+                 pool_maxsize=10, idle_timeout=None, socket_options=None):
         """
         Create a new client for interacting with WebHDFS
 
@@ -29,6 +45,24 @@ class PyWebHdfsClient(object):
         :param base_uri_pattern: format string for base URI
         :param request_extra_opts: dictionary of extra options to pass
           to the requests library (e.g., SSL, HTTP authentication, etc.)
+        :param redirect_cache_ttl: number of seconds to remember the datanode
+          an OPEN request was redirected to (def: 0, disabled)
+        :param redirect_block_size: size of the file ranges the datanode
+          locations are remembered for, normally the HDFS block size
+        :param redirect_cache_size: maximum number of remembered locations
+        :param metrics: optional object with inc(name, value=1, **labels)
+          and observe(name, seconds, **labels) methods, which is given the
+          request counts and latencies, the decoding times, the received
+          bytes and the namenode failovers
+        :param pool_hosts: number of hosts (namenodes and datanodes) every
+          thread keeps connections to
+        :param pool_maxsize: maximum number of connections every thread
+          keeps to a host
+        :param idle_timeout: number of seconds after which the connections
+          of a thread which sent no request are closed rather than reused
+          (def: None, never), normally shorter than the server's idle timeout
+        :param socket_options: options set on new sockets, TCP_NODELAY and
+          TCP keepalive by default, see keepalive_socket_options
 
         >>> hdfs = PyWebHdfsClient(host='host',port='50070', user_name='hdfs')
 
@@ -44,7 +78,13 @@ class PyWebHdfsClient(object):
         self.port = port
         self.user_name = user_name
         self.timeout = timeout
-        self.session = requests.Session()
+        # Every thread gets its own session (and connection pool), since
+        # requests.Session is not safe to share between concurrent requests.
+        # They are kept by thread id as [session, last used] rather than in
+        # a threading.local, whose values are dropped after every call into
+        # Python from a thread created by C code, like the FUSE threads.
+        self._sessions = {}
+        self._sessions_lock = threading.Lock()
         self.path_to_hosts = path_to_hosts
         if self.path_to_hosts is None:
             self.path_to_hosts = [('.*', [self.host])]
@@ -52,6 +92,111 @@ class PyWebHdfsClient(object):
         self.base_uri_pattern = base_uri_pattern.format(
             host="{host}", port=port)
         self.request_extra_opts = request_extra_opts
+        # The compiled path_to_hosts and the base uris of the hosts, along
+        # with the path_to_hosts and base_uri_pattern they were made of
+        self._federation = (None, [])
+        self._base_uris = (None, {})
+
+        self.redirect_cache_ttl = redirect_cache_ttl
+        self.redirect_block_size = redirect_block_size
+        self.redirect_cache_size = redirect_cache_size
+        self._redirect_cache = OrderedDict()
+        self._redirect_cache_lock = threading.Lock()
+        self._list_batch_supported = True
+        self._fs_status_supported = True
+        self._quota_usage_supported = True
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self.metrics = metrics
+
+        self.pool_hosts = pool_hosts
+        self.pool_maxsize = pool_maxsize
+        self.idle_timeout = idle_timeout
+        self.socket_options = socket_options
+        if self.socket_options is None:
+            self.socket_options = keepalive_socket_options()
+        # The connection and request counts of closed connection pools
+        self._closed_pools_stats = [0, 0]
+
+    @property
+    def session(self):
+        """
+        The requests session of the calling thread
+        """
+        entry = self._sessions.get(threading.get_ident())
+        now = time.monotonic()
+        if entry is None or (self.idle_timeout is not None and
+                             now - entry[1] > self.idle_timeout):
+            # Either the thread has no session yet, or all of its
+            # connections are idle and may have been closed by the server
+            # by now
+            return self._add_session()
+        entry[1] = now
+        return entry[0]
+
+    def _add_session(self):
+        """
+        Create the session of the calling thread, and close the sessions
+        unused for longer than idle_timeout, e.g. those of threads which
+        have exited, so that their pooled connections don't stay open.
+        Threads can't be checked for having exited: the FUSE threads are
+        created by libfuse and unknown to the threading module.
+        """
+        session = self._new_session()
+        now = time.monotonic()
+        with self._sessions_lock:
+            idle = []
+            if self.idle_timeout is not None:
+                idle = [ident for ident, (_, last_used) in self._sessions.items()
+                        if now - last_used > self.idle_timeout]
+            idle_sessions = [self._sessions.pop(ident)[0] for ident in idle]
+            self._sessions[threading.get_ident()] = [session, now]
+        for idle_session in idle_sessions:
+            idle_session.close()
+        return session
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = _PoolAdapter(self.socket_options, self._count_closed_pool,
+                               pool_connections=self.pool_hosts,
+                               pool_maxsize=self.pool_maxsize)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _count_closed_pool(self, pool):
+        with self._sessions_lock:
+            self._closed_pools_stats[0] += pool.num_connections
+            self._closed_pools_stats[1] += pool.num_requests
+
+    def connection_stats(self):
+        """
+        The number of connections opened and of requests sent over them,
+        and how many of the requests reused a pooled connection
+        """
+        with self._sessions_lock:
+            connections, requests_sent = self._closed_pools_stats
+            sessions = [entry[0] for entry in self._sessions.values()]
+        for session in sessions:
+            for adapter in set(session.adapters.values()):
+                for pool in _iter_pools(adapter):
+                    connections += pool.num_connections
+                    requests_sent += pool.num_requests
+        return dict(connections=connections, requests=requests_sent,
+                    reused=max(0, requests_sent - connections))
+
+    def close(self):
+        """
+        Close the sessions of all threads and their pooled connections
+        """
+        with self._sessions_lock:
+            sessions, self._sessions = self._sessions, {}
+        for session, _ in sessions.values():
+            session.close()
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
 
     def create_file(self, path, file_data, **kwargs):
         """
@@ -173,6 +318,51 @@ class PyWebHdfsClient(object):
 
         return True
 
+    def stream_create_file(self, path, producer, chunk_size=1024 * 1024,
+                           **kwargs):
+        """
+        Creates a new file on HDFS with data streamed from a producer
+
+        :param path: the HDFS file path
+        :param producer: an iterator of bytes or a file like object
+        :param chunk_size: size of the chunks read from a file like object
+
+        The data is sent to the datanode with chunked transfer encoding as it
+        is produced, so the file is never held in memory as a whole. Accepts
+        the same WebHDFS optional arguments as create_file.
+
+        Example:
+
+        >>> hdfs = PyWebHdfsClient(host='host',port='50070', user_name='hdfs')
+        >>> with open('file.data', 'rb') as file_data:
+        >>>     hdfs.stream_create_file(hdfs_path, file_data, overwrite=True)
+        """
+
+        return self.create_file(path, _iter_chunks(producer, chunk_size),
+                                **kwargs)
+
+    def stream_append_file(self, path, producer, chunk_size=1024 * 1024,
+                           **kwargs):
+        """
+        Appends data streamed from a producer to an existing file on HDFS
+
+        :param path: the HDFS file path
+        :param producer: an iterator of bytes or a file like object
+        :param chunk_size: size of the chunks read from a file like object
+
+        The data is sent to the datanode with chunked transfer encoding as it
+        is produced. Accepts the same WebHDFS optional arguments as
+        append_file.
+
+        Example:
+
+        >>> hdfs = PyWebHdfsClient(host='host',port='50070', user_name='hdfs')
+        >>> hdfs.stream_append_file(hdfs_path, (b'line\n' for _ in range(10)))
+        """
+
+        return self.append_file(path, _iter_chunks(producer, chunk_size),
+                                **kwargs)
+
     def read_file(self, path, **kwargs):
         """
         Reads from a file on HDFS  and returns the content
@@ -185,7 +375,8 @@ class PyWebHdfsClient(object):
 
         [&offset=<LONG>][&length=<LONG>][&buffersize=<INT>]
 
-        Note: this function follows automatic redirects
+        Note: this function follows redirects itself and, if enabled,
+        remembers the datanode location to skip the namenode next time
 
         Example:
 
@@ -200,14 +391,150 @@ class PyWebHdfsClient(object):
 
         optional_args = kwargs
 
-        response = self._resolve_host(self.session.get, True,
-                                      path, operations.OPEN,
-                                      **optional_args)
+        response = self._open(path, stream=False, **optional_args)
         if not response.status_code == HTTPStatus.OK:
             _raise_pywebhdfs_exception(response.status_code, response.content)
 
+        if self.metrics is not None:
+            self.metrics.inc('webhdfs_received_bytes_total', len(response.content))
         return response.content
 
+    def read_file_into(self, path, buffers, offset=0, **kwargs):
+        """
+        Reads a range of a file on HDFS straight into preallocated buffers
+
+        :param path: the HDFS file path
+        :param buffers: a writable buffer (bytearray, memoryview, ...) or a
+          list of them, filled one after the other
+        :param offset: the offset of the range in the file
+
+        The length of the range is the total size of the buffers. The
+        response body is read from the connection directly into the
+        buffers, without intermediate bytes objects. Returns the number of
+        bytes received, which is less than the size of the buffers if the
+        file ends before.
+
+        Example:
+
+        >>> hdfs = PyWebHdfsClient(host='host',port='50070', user_name='hdfs')
+        >>> my_file = 'user/hdfs/data/myfile.txt'
+        >>> buf = bytearray(4 * 1024 * 1024)
+        >>> hdfs.read_file_into(my_file, buf, offset=1024)
+        4194304
+        """
+
+        if not isinstance(buffers, (list, tuple)):
+            buffers = [buffers]
+        views = [memoryview(buf).cast('B') for buf in buffers]
+        length = sum(len(view) for view in views)
+        if not length:
+            return 0
+
+        response = self._open(path, stream=True, offset=offset, length=length,
+                              **kwargs)
+        if not response.status_code == HTTPStatus.OK:
+            _raise_pywebhdfs_exception(response.status_code, response.content)
+
+        received = 0
+        try:
+            readinto = _get_readinto(response)
+            for view in views:
+                filled = 0
+                while filled < len(view):
+                    size = readinto(view[filled:])
+                    if not size:
+                        break
+                    filled += size
+                received += filled
+                if filled < len(view):
+                    break
+        finally:
+            for view in views:
+                view.release()
+        if self.metrics is not None:
+            self.metrics.inc('webhdfs_received_bytes_total', received)
+        if received == length:
+            # Hand the connection back to the pool for reuse
+            response.raw.release_conn()
+        else:
+            response.close()
+        return received
+
+    def read_file_parallel_into(self, path, parts, max_workers=4):
+        """
+        Reads several ranges of a file on HDFS with concurrent requests
+
+        :param path: the HDFS file path
+        :param parts: a list of (offset, buffer) tuples, the range starting
+          at every offset is read into its buffer with read_file_into
+        :param max_workers: maximum number of concurrent requests
+
+        Returns the number of bytes received for every part.
+        """
+
+        def read_part(part):
+            offset, buf = part
+            return self.read_file_into(path, buf, offset=offset)
+
+        if len(parts) == 1 or max_workers < 2:
+            return list(map(read_part, parts))
+        return list(self._get_executor(max_workers).map(read_part, parts))
+
+    def read_file_parallel(self, path, offset, length,
+                           part_size=None, max_workers=4):
+        """
+        Reads a range of a file on HDFS with several concurrent requests
+
+        :param path: the HDFS file path
+        :param offset: the offset of the range in the file
+        :param length: the length of the range
+        :param part_size: the size of the parts the range is split into
+          (def: redirect_block_size, i.e. one request per HDFS block)
+        :param max_workers: maximum number of concurrent requests
+
+        The parts never cross HDFS block boundaries, so every part is
+        served by a single datanode and different blocks may come from
+        different datanodes. They are read into a preallocated bytearray,
+        which is returned. It is shorter than length if the file ends
+        before the end of the range.
+
+        Example:
+
+        >>> hdfs = PyWebHdfsClient(host='host',port='50070', user_name='hdfs')
+        >>> my_file = 'user/hdfs/data/myfile.txt'
+        >>> data = hdfs.read_file_parallel(my_file, 0, 1024 * 1024 * 1024,
+        >>>                                part_size=16 * 1024 * 1024)
+        """
+
+        ranges = _split_range(offset, length, part_size or self.redirect_block_size,
+                              self.redirect_block_size)
+
+        buf = bytearray(length)
+        with memoryview(buf) as view:
+            parts = [(start, view[start - offset:stop - offset])
+                     for start, stop in ranges]
+            received = self.read_file_parallel_into(path, parts, max_workers)
+            for _, part in parts:
+                part.release()
+
+        for (start, stop), size in zip(ranges, received):
+            if size < stop - start:
+                # The file ended within this part
+                del buf[start - offset + size:]
+                break
+        return buf
+
+    def _get_executor(self, max_workers):
+        with self._executor_lock:
+            if (self._executor is None or
+                    self._executor._max_workers < max_workers):
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                self._executor = ThreadPoolExecutor(
+                    max_workers=max_workers,
+                    thread_name_prefix='webhdfs-read')
+            return self._executor
+
     def stream_file(self, path, chunk_size=1024, **kwargs):
         """
         Reads from a file on HDFS  and returns the content
@@ -220,7 +547,8 @@ class PyWebHdfsClient(object):
 
         [&offset=<LONG>][&length=<LONG>][&buffersize=<INT>]
 
-        Note: this function follows automatic redirects
+        Note: this function follows redirects itself and, if enabled,
+        remembers the datanode location to skip the namenode next time
 
         Example:
 
@@ -235,14 +563,14 @@ class PyWebHdfsClient(object):
 
         optional_args = kwargs
 
-        response = self._resolve_host(self.session.get, True,
-                                      path, operations.OPEN, stream=True,
-                                      **optional_args)
+        response = self._open(path, stream=True, **optional_args)
         if not response.status_code == HTTPStatus.OK:
             _raise_pywebhdfs_exception(response.status_code, response.content)
 
         for chunk in response.iter_content(chunk_size):
             if chunk:
+                if self.metrics is not None:
+                    self.metrics.inc('webhdfs_received_bytes_total', len(chunk))
                 yield chunk
 
     def make_dir(self, path, **kwargs):
@@ -338,11 +666,13 @@ class PyWebHdfsClient(object):
 
         return True
 
-    def get_file_dir_status(self, path):
+    def get_file_dir_status(self, path, file_status_hook=None):
         """
         Get the file_status of a single file or directory on HDFS
 
         :param path: the HDFS file path
+        :param file_status_hook: optional function the FileStatus object is
+          passed through while the response is decoded
 
         The function wraps the WebHDFS REST call:
 
@@ -393,7 +723,7 @@ class PyWebHdfsClient(object):
         if not response.status_code == HTTPStatus.OK:
             _raise_pywebhdfs_exception(response.status_code, response.content)
 
-        return response.json()
+        return self._decode_json(response, file_status_hook)
 
     def get_content_summary(self, path):
         """
@@ -430,6 +760,83 @@ class PyWebHdfsClient(object):
 
         return response.json()
 
+    def get_fs_status(self, path='/'):
+        """
+        Get the capacity, used and remaining space of the file system
+
+        :param path: any HDFS path of the file system
+
+        The function wraps the WebHDFS REST call, available since Hadoop
+        3.3, and returns None if the namenode doesn't support it:
+
+        GET http://<HOST>:<PORT>/webhdfs/v1/<PATH>?op=GETSTATUS
+
+        Example for getting the file system status:
+
+        >>> hdfs = PyWebHdfsClient(host='host',port='50070', user_name='hdfs')
+        >>> hdfs.get_fs_status()
+        {
+            "FsStatus":
+            {
+                "capacity": 1000000000000,
+                "used": 24930,
+                "remaining": 999999975070
+            }
+        }
+        """
+
+        if not self._fs_status_supported:
+            return None
+        response = self._resolve_host(self.session.get, True,
+                                      path, operations.GETSTATUS)
+        if _is_unsupported_operation(response, operations.GETSTATUS):
+            self._fs_status_supported = False
+            return None
+        if not response.status_code == HTTPStatus.OK:
+            _raise_pywebhdfs_exception(response.status_code, response.content)
+
+        return response.json()
+
+    def get_quota_usage(self, path):
+        """
+        Get the namespace and space quotas of a directory and their usage
+
+        :param path: the HDFS file path
+
+        The function wraps the WebHDFS REST call, available since Hadoop
+        3.2, and returns None if the namenode doesn't support it. Unlike
+        GETCONTENTSUMMARY it doesn't walk the tree below directories with
+        a quota, such as the root directory:
+
+        GET http://<HOST>:<PORT>/webhdfs/v1/<PATH>?op=GETQUOTAUSAGE
+
+        Example for getting the quota usage of the root directory:
+
+        >>> hdfs = PyWebHdfsClient(host='host',port='50070', user_name='hdfs')
+        >>> hdfs.get_quota_usage('/')
+        {
+            "QuotaUsage":
+            {
+                "fileAndDirectoryCount": 3,
+                "quota": 9223372036854775807,
+                "spaceConsumed": 74790,
+                "spaceQuota": -1
+            }
+        }
+        """
+
+        if not self._quota_usage_supported:
+            return None
+        response = self._resolve_host(self.session.get, True,
+                                      path, operations.GETQUOTAUSAGE)
+        if _is_unsupported_operation(response, operations.GETQUOTAUSAGE):
+            self._quota_usage_supported = False
+            return None
+        if not response.status_code == HTTPStatus.OK:
+            _raise_pywebhdfs_exception(response.status_code, response.content)
+
+        return response.json()
+
     def get_file_checksum(self, path):
         """
         Get the file_checksum of a single file on HDFS
@@ -461,12 +868,15 @@ class PyWebHdfsClient(object):
 
         return response.json()
 
-    def list_dir(self, path):
+    def list_dir(self, path, file_status_hook=None):
         """
         Get a list of file_status for all files and directories
         inside an HDFS directory
 
         :param path: the HDFS file path
+        :param file_status_hook: optional function every FileStatus object is
+          passed through while the response is decoded, e.g. to convert it
+          into a more compact representation
 
         The function wraps the WebHDFS REST call:
 
@@ -514,7 +924,71 @@ class PyWebHdfsClient(object):
         if not response.status_code == HTTPStatus.OK:
             _raise_pywebhdfs_exception(response.status_code, response.content)
 
-        return response.json()
+        return self._decode_json(response, file_status_hook)
+
+    def iter_list_dir(self, path, file_status_hook=None):
+        """
+        Iterate over the file_status of all files and directories inside an
+        HDFS directory, fetching the listing page by page
+
+        :param path: the HDFS file path
+        :param file_status_hook: optional function every FileStatus object is
+          passed through while the response is decoded
+
+        The function wraps the WebHDFS REST call:
+
+        GET http://<HOST>:<PORT>/webhdfs/v1/<PATH>?op=LISTSTATUS_BATCH
+
+        [&startAfter=<CHILD>]
+
+        and falls back to a single LISTSTATUS call on servers which don't
+        support LISTSTATUS_BATCH (before Hadoop 2.8).
+
+        Example for listing a huge directory:
+
+        >>> hdfs = PyWebHdfsClient(host='host',port='50070', user_name='hdfs')
+        >>> for file_status in hdfs.iter_list_dir('user/hdfs'):
+        >>>     print(file_status['pathSuffix'])
+        example3.txt
+        example2.txt
+        """
+
+        last_path_suffix = [None]
+
+        def path_suffix_hook(file_status):
+            last_path_suffix[0] = file_status["pathSuffix"]
+            if file_status_hook is None:
+                return file_status
+            return file_status_hook(file_status)
+
+        start_after = None
+        while True:
+            if not self._list_batch_supported:
+                yield from self.list_dir(
+                    path, file_status_hook)["FileStatuses"]["FileStatus"]
+                return
+            optional_args = {}
+            if start_after is not None:
+                optional_args['startAfter'] = start_after
+            response = self._resolve_host(self.session.get, True,
+                                          path, operations.LISTSTATUS_BATCH,
+                                          **optional_args)
+            if start_after is None and _is_unsupported_operation(
+                    response, operations.LISTSTATUS_BATCH):
+                self._list_batch_supported = False
+                continue
+            if not response.status_code == HTTPStatus.OK:
+                _raise_pywebhdfs_exception(response.status_code,
+                                           response.content)
+
+            listing = self._decode_json(
+                response, path_suffix_hook)["DirectoryListing"]
+            file_statuses = \
+                listing["partialListing"]["FileStatuses"]["FileStatus"]
+            yield from file_statuses
+            if not listing["remainingEntries"] or not file_statuses:
+                return
+            start_after = last_path_suffix[0]
 
     def exists_file_dir(self, path):
         """
@@ -600,6 +1074,40 @@ class PyWebHdfsClient(object):
 
         return True
 
+    def set_times(self, path, modification_time=None, access_time=None):
+        """
+        Set the modification and access times of a file on HDFS
+
+        :param path: the HDFS file path
+        :param modification_time: the modification time, in milliseconds
+          since the epoch (def: unchanged)
+        :param access_time: the access time, in milliseconds since the epoch
+          (def: unchanged)
+
+        The function wraps the WebHDFS REST call:
+
+        PUT http://<HOST>:<PORT>/webhdfs/v1/<PATH>?op=SETTIMES
+
+        [&modificationtime=<TIME>][&accesstime=<TIME>]
+
+        Example:
+
+        >>> hdfs = PyWebHdfsClient(host='host',port='50070', user_name='hdfs')
+        >>> my_file = 'user/hdfs/data/myfile.txt'
+        >>> hdfs.set_times(my_file, modification_time=1371737704595)
+        """
+
+        response = self._resolve_host(self.session.put, True,
+                                      path, operations.SETTIMES,
+                                      modificationtime=-1 if modification_time is None
+                                      else int(modification_time),
+                                      accesstime=-1 if access_time is None
+                                      else int(access_time))
+        if not response.status_code == HTTPStatus.OK:
+            _raise_pywebhdfs_exception(response.status_code, response.content)
+
+        return True
+
     def get_xattr(self, path, xattr=None):
         """
         Get extended attributes set on an HDFS path
@@ -730,50 +1238,136 @@ class PyWebHdfsClient(object):
             _raise_pywebhdfs_exception(response.status_code, response.content)
         return True
 
-    def _create_uri(self, path, operation, **kwargs):
+    def _open(self, path, stream, **kwargs):
         """
-        internal function used to construct the WebHDFS request uri based on
-        the <PATH>, <OPERATION>, and any provided optional arguments
+        internal function used to make an OPEN request. The redirect to the
+        datanode is followed manually so that the datanode location can be
+        cached per (path, block) and reused for later reads of the same block
+        with only the offset and length rewritten.
         """
+        key = (path, int(kwargs.get('offset', 0)) // self.redirect_block_size)
+        location = self._get_cached_location(key)
+        if location is not None:
+            try:
+                response = self._datanode_get(
+                    _rewrite_location(location, kwargs), stream)
+                if response.status_code == HTTPStatus.OK:
+                    return response
+                response.close()
+            except requests.exceptions.RequestException:
+                pass
+            self._forget_location(key)
 
-        no_root_path = (path[1:] if path[0] == '/' else path)
-        path_param = quote(no_root_path.encode('utf8'))
+        response = self._resolve_host(self.session.get, False,
+                                      path, operations.OPEN, **kwargs)
+        if not response.status_code == HTTPStatus.TEMPORARY_REDIRECT:
+            return response
 
-        # setup the parameter represent the WebHDFS operation
-        operation_param = '?op={operation}'.format(operation=operation)
+        location = response.headers['location']
+        self._cache_location(key, location)
+        return self._datanode_get(location, stream)
 
-        # configure authorization based on provided credentials
-        auth_param = str()
-        if self.user_name:
-            auth_param = '&user.name={user_name}'.format(
-                user_name=self.user_name)
+    def _datanode_get(self, location, stream):
+        """
+        internal function used to send a redirected OPEN request to the
+        datanode, timed up to the response headers
+        """
+        if self.metrics is None:
+            return self.session.get(location, stream=stream,
+                                    timeout=self.timeout,
+                                    **self.request_extra_opts)
+        start = time.monotonic()
+        try:
+            response = self.session.get(location, stream=stream,
+                                        timeout=self.timeout,
+                                        **self.request_extra_opts)
+        except requests.exceptions.RequestException:
+            self.metrics.inc('webhdfs_request_errors_total',
+                             node='datanode', op=operations.OPEN)
+            raise
+        self._observe_request('datanode', operations.OPEN, response, start)
+        return response
+
+    def _get_cached_location(self, key):
+        if not self.redirect_cache_ttl:
+            return None
+        with self._redirect_cache_lock:
+            cached = self._redirect_cache.get(key)
+            if cached is None:
+                return None
+            expires, location = cached
+            if expires < time.monotonic():
+                del self._redirect_cache[key]
+                return None
+            return location
+
+    def _cache_location(self, key, location):
+        if not self.redirect_cache_ttl:
+            return
+        expires = time.monotonic() + self.redirect_cache_ttl
+        with self._redirect_cache_lock:
+            self._redirect_cache.pop(key, None)
+            self._redirect_cache[key] = (expires, location)
+            if len(self._redirect_cache) > self.redirect_cache_size:
+                self._redirect_cache.popitem(last=False)
+
+    def _forget_location(self, key):
+        with self._redirect_cache_lock:
+            self._redirect_cache.pop(key, None)
+
+    def _create_uri_suffix(self, path, operation, **kwargs):
+        """
+        internal function used to construct the part of the WebHDFS request
+        uri following the base uri of the host, based on the <PATH>,
+        <OPERATION>, and any provided optional arguments
+        """
+        parts = [quote(path[1:] if path[:1] == '/' else path),
+                 '?op=', operation]
 
         # setup any optional parameters
-        keyword_params = str()
-        for key in kwargs:
-            try:
-                value = quote_plus(kwargs[key].encode('utf8'))
-            except:
-                value = str(kwargs[key]).lower()
-            keyword_params = '{params}&{key}={value}'.format(
-                params=keyword_params, key=key, value=value)
+        for key, value in kwargs.items():
+            parts.append('&')
+            parts.append(key)
+            parts.append('=')
+            if isinstance(value, str):
+                parts.append(quote_plus(value))
+            else:
+                parts.append(str(value).lower())
 
-        base_uri = self.base_uri_pattern.format(host="{host}")
+        # configure authorization based on provided credentials
+        if self.user_name:
+            parts.append('&user.name=')
+            parts.append(self.user_name)
 
-        # build the complete uri from the base uri and all configured params
-        uri = '{base_uri}{path}{operation}{keyword_args}{auth}'.format(
-            base_uri=base_uri, path=path_param,
-            operation=operation_param, keyword_args=keyword_params,
-            auth=auth_param)
+        return ''.join(parts)
 
-        return uri
+    def _base_uri(self, host):
+        """
+        internal function used to get the base uri of a host, built once
+        per host as long as base_uri_pattern doesn't change
+        """
+        pattern, base_uris = self._base_uris
+        if pattern is not self.base_uri_pattern:
+            pattern, base_uris = self.base_uri_pattern, {}
+            self._base_uris = (pattern, base_uris)
+        base_uri = base_uris.get(host)
+        if base_uri is None:
+            base_uri = base_uris[host] = pattern.format(host=host)
+        return base_uri
 
     def _resolve_federation(self, path):
         """
-        internal function used to resolve federation
+        internal function used to resolve federation. The path regexps are
+        compiled once, as long as path_to_hosts doesn't change.
         """
-        for path_regexp, hosts in self.path_to_hosts:
-            if re.match(path_regexp, path):
+        path_to_hosts, patterns = self._federation
+        if path_to_hosts is not self.path_to_hosts:
+            path_to_hosts = self.path_to_hosts
+            patterns = [(re.compile(path_regexp), hosts)
+                        for path_regexp, hosts in path_to_hosts]
+            self._federation = (path_to_hosts, patterns)
+        for pattern, hosts in patterns:
+            if pattern.match(path):
                 return hosts
         raise errors.CorrespondHostsNotFound(
             msg="Could not find hosts corresponds to /{0}".format(path))
@@ -784,22 +1378,221 @@ class PyWebHdfsClient(object):
         internal function used to resolve federation and HA and
         return response of resolved host.
         """
-        uri_without_host = self._create_uri(path, operation, **kwargs)
+        uri_suffix = self._create_uri_suffix(path, operation, **kwargs)
         hosts = self._resolve_federation(path)
-        for host in hosts:
-            uri = uri_without_host.format(host=host)
+        metrics = self.metrics
+        # Iterate over a copy, as concurrent requests reorder the hosts
+        for host in list(hosts):
+            uri = self._base_uri(host) + uri_suffix
+            if metrics is not None:
+                start = time.monotonic()
             try:
                 response = req_func(uri, allow_redirects=allow_redirect,
                                     timeout=self.timeout,
                                     **self.request_extra_opts)
 
+                if metrics is not None:
+                    self._observe_request('namenode', operation,
+                                          response, start)
                 if not _is_standby_exception(response):
                     _move_active_host_to_head(hosts, host)
                     return response
+                if metrics is not None:
+                    metrics.inc('webhdfs_failovers_total', op=operation,
+                                reason='standby')
             except requests.exceptions.RequestException:
+                if metrics is not None:
+                    metrics.inc('webhdfs_request_errors_total',
+                                node='namenode', op=operation)
+                    metrics.inc('webhdfs_failovers_total', op=operation,
+                                reason='connection')
                 continue
         raise errors.ActiveHostNotFound(msg="Could not find active host")
 
+    def _observe_request(self, node, operation, response, start):
+        self.metrics.observe('webhdfs_request_seconds',
+                             time.monotonic() - start,
+                             node=node, op=operation)
+        if response.status_code >= 400:
+            self.metrics.inc('webhdfs_request_errors_total',
+                             node=node, op=operation,
+                             status=response.status_code)
+
+    def _decode_json(self, response, file_status_hook=None):
+        """
+        internal function used to decode a JSON response body, timed if
+        metrics are enabled
+        """
+        if self.metrics is None:
+            return _decode_json(response, file_status_hook)
+        start = time.monotonic()
+        body = _decode_json(response, file_status_hook)
+        self.metrics.observe('webhdfs_decode_seconds',
+                             time.monotonic() - start)
+        return body
+
+
+def keepalive_socket_options(idle=60, interval=10, count=6):
+    """
+    Socket options disabling Nagle's algorithm and probing idle connections
+    with TCP keepalive after idle seconds, every interval seconds, up to
+    count times, so that connections through NATs, firewalls and SOCKS
+    proxies stay open and dead ones are detected
+    """
+    options = [(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+               (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    # Not available on every platform
+    for name, value in (('TCP_KEEPIDLE', idle), ('TCP_KEEPINTVL', interval),
+                        ('TCP_KEEPCNT', count)):
+        if hasattr(socket, name):
+            options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    return options
+
+
+class _PoolAdapter(HTTPAdapter):
+    """
+    An HTTPAdapter setting socket_options on new connections, proxied ones
+    included, and passing its connection pools to on_close when they are
+    discarded, so that their statistics aren't lost
+    """
+
+    def __init__(self, socket_options, on_close, **kwargs):
+        self._socket_options = socket_options
+        self._on_close = on_close
+        super().__init__(**kwargs)
+
+    def _close_pool(self, pool):
+        self._on_close(pool)
+        pool.close()
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = self._socket_options
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pools.dispose_func = self._close_pool
+
+    def proxy_manager_for(self, proxy, **kwargs):
+        if proxy in self.proxy_manager:
+            return self.proxy_manager[proxy]
+        kwargs['socket_options'] = self._socket_options
+        manager = super().proxy_manager_for(proxy, **kwargs)
+        manager.pools.dispose_func = self._close_pool
+        return manager
+
+
+def _iter_pools(adapter):
+    """
+    The connection pools of an HTTPAdapter, of all its proxies included
+    """
+    managers = [adapter.poolmanager] + list(adapter.proxy_manager.values())
+    for manager in managers:
+        pools = manager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                yield pool
+
+
+def _decode_json(response, file_status_hook=None):
+    """
+    decode a JSON response body, passing every FileStatus object through
+    file_status_hook
+    """
+    return _loads_json(response.content, file_status_hook)
+
+
+def _loads_json(content, file_status_hook=None):
+    """
+    decode a JSON document, passing every FileStatus object through
+    file_status_hook. orjson is used if it is installed, otherwise the
+    FileStatus objects are converted by the standard JSON decoder as soon as
+    they are parsed, without building the whole tree of dicts first.
+    """
+    if orjson is not None:
+        body = orjson.loads(content)
+        if file_status_hook is not None:
+            _convert_file_statuses(body, file_status_hook)
+        return body
+    if file_status_hook is None:
+        return json.loads(content)
+
+    def object_hook(obj):
+        if 'pathSuffix' in obj and 'type' in obj:
+            return file_status_hook(obj)
+        return obj
+    return json.loads(content, object_hook=object_hook)
+
+
+def _convert_file_statuses(body, file_status_hook):
+    """
+    pass the FileStatus objects of a decoded GETFILESTATUS, LISTSTATUS or
+    LISTSTATUS_BATCH response through file_status_hook in place
+    """
+    if 'FileStatus' in body:
+        body['FileStatus'] = file_status_hook(body['FileStatus'])
+        return
+    if 'DirectoryListing' in body:
+        body = body['DirectoryListing']['partialListing']
+    file_statuses = body['FileStatuses']['FileStatus']
+    file_statuses[:] = map(file_status_hook, file_statuses)
+
+
+def _get_readinto(response):
+    """
+    get the function reading the body of a streamed response into a buffer.
+    Unless the body is content-encoded, it is read directly from the
+    underlying http.client response, since urllib3's readinto reads into
+    a temporary bytes object first.
+    """
+    fp = getattr(response.raw, '_fp', None)
+    if (fp is not None and hasattr(fp, 'readinto') and
+            not response.headers.get('content-encoding')):
+        return fp.readinto
+    return response.raw.readinto
+
+
+def _iter_chunks(producer, chunk_size):
+    """
+    turn a file like object or an iterator into a generator, which makes
+    requests send it with chunked transfer encoding
+    """
+    if hasattr(producer, 'read'):
+        while True:
+            chunk = producer.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        for chunk in producer:
+            if chunk:
+                yield chunk
+
+
+def _split_range(offset, length, part_size, block_size):
+    """
+    split a range of a file into (start, stop) parts of at most part_size
+    bytes, which don't cross HDFS block boundaries
+    """
+    end = offset + length
+    boundaries = set([offset, end])
+    for size in (part_size, block_size):
+        boundaries.update(range((offset // size + 1) * size, end, size))
+    boundaries = sorted(boundaries)
+    return list(zip(boundaries, boundaries[1:]))
+
+
+def _rewrite_location(location, kwargs):
+    """
+    replace the offset and length of a datanode OPEN location
+    with the ones of a new request
+    """
+    parts = urlsplit(location)
+    query = [(key, value) for key, value in parse_qsl(parts.query)
+             if key not in ('offset', 'length')]
+    query.append(('offset', str(kwargs.get('offset', 0))))
+    if kwargs.get('length') is not None:
+        query.append(('length', str(kwargs['length'])))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
 
 def _raise_pywebhdfs_exception(resp_code, message=None):
 
@@ -821,9 +1614,13 @@ def _is_standby_exception(response):
     """
     check whether response is StandbyException or not.
     """
-    if response.status_code == HTTPStatus.FORBIDDEN:
+    return _is_standby_content(response.status_code, response.content)
+
+
+def _is_standby_content(status_code, content):
+    if status_code == HTTPStatus.FORBIDDEN:
         try:
-            body = response.json()
+            body = json.loads(content)
             exception = body["RemoteException"]["exception"]
             if exception == "StandbyException":
                 return True
@@ -832,9 +1629,37 @@ def _is_standby_exception(response):
     return False
 
 
+def _is_unsupported_operation(response, operation):
+    """
+    check whether response rejects the operation as unknown to the server.
+    """
+    return _is_unsupported_content(response.status_code, response.content,
+                                   operation)
+
+
+def _is_unsupported_content(status_code, content, operation):
+    if status_code == HTTPStatus.BAD_REQUEST:
+        try:
+            body = json.loads(content)
+            exception = body["RemoteException"]["exception"]
+            message = body["RemoteException"]["message"]
+            if (exception == "IllegalArgumentException" and
+                    operation in message):
+                return True
+        except:
+            pass
+    return False
+
+
 def _move_active_host_to_head(hosts, active_host):
     """
     to improve efficiency move active host to head
     """
-    hosts.remove(active_host)
+    if hosts[0] == active_host:
+        return
+    try:
+        hosts.remove(active_host)
+    except ValueError:
+        # Moved by a concurrent request
+        return
     hosts.insert(0, active_host)
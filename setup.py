@@ -120,9 +120,9 @@ setup(
     # the `py_modules` argument instead as follows, which will expect a file
     # called `my_module.py` to exist:
     #
-    py_modules=["webhdfs", "mount_webhdfs"],
+    py_modules=["webhdfs", "webhdfs_cli", "mount_webhdfs"],
     #
-    packages=find_packages(exclude=['contrib', 'docs', 'tests']),  # Required
+    packages=find_packages(exclude=['contrib', 'docs', 'tests', 'benchmarks']),  # Required
 
     # This field lists other packages that your project depends on to run.
     # Any package you put here will be installed by pip when your project is
@@ -149,6 +149,8 @@ setup(
     extras_require={  # Optional
         'dev': ['check-manifest'],
         'test': ['coverage'],
+        'fast': ['orjson'],
+        'async': ['aiohttp'],
     },
 
     # If there are data files included in your packages that need to be
@@ -174,11 +176,11 @@ setup(
     #
     # For example, the following would provide a command called `sample` which
     # executes the function `main` from this package when invoked:
-    # entry_points={  # Optional
-    #    'console_scripts': [
-    #        'sample=sample:main',
-    #    ],
-    # },
+    entry_points={  # Optional
+        'console_scripts': [
+            'webhdfs=webhdfs_cli:main',
+        ],
+    },
 
     # List additional URLs that are relevant to your project as a dict.
     #
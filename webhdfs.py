@@ -2,8 +2,9 @@
 
 import pwd
 import grp
+import socket
 from config.webhdfs import configure
-from pywebhdfs.webhdfs import PyWebHdfsClient
+from pywebhdfs.webhdfs import PyWebHdfsClient, keepalive_socket_options
 from stat import S_IFDIR, S_IFLNK, S_IFREG
 from time import time
 import datetime
@@ -40,32 +41,80 @@ def webhdfs_connect(config):
                                         'https': f'socks5h://{config.proxy_host}:{config.proxy_port}'}
     if config.hdfs_user_name:
         request_extra_opts['params'] ={'user.name': config.hdfs_user_name}
+    if config.tcp_keepalive:
+        socket_options = keepalive_socket_options(idle=config.tcp_keepalive)
+    else:
+        socket_options = [(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)]
     client = PyWebHdfsClient(base_uri_pattern=config.hdfs_baseurl,
-                             request_extra_opts=request_extra_opts)
+                             request_extra_opts=request_extra_opts,
+                             redirect_cache_ttl=config.redirect_ttl,
+                             pool_maxsize=config.max_host_connections,
+                             idle_timeout=config.idle_timeout or None,
+                             socket_options=socket_options)
     return client
 
-def webhdfs_entry_to_dict(s):
+class FileStat(object):
+    """
+    Compact attributes of an HDFS file or directory.
+
+    Cached in place of the dict FUSE expects from getattr, which is only
+    built by to_dict() when getattr is actually served.
+    """
+    __slots__ = ('st_mode', 'st_mtime', 'st_atime', 'st_nlink',
+                 'st_size', 'st_uid', 'st_gid', 'st_blksize')
+
+    def __init__(self, st_mode, st_mtime, st_atime, st_nlink,
+                 st_size, st_uid, st_gid, st_blksize):
+        self.st_mode = st_mode
+        self.st_mtime = st_mtime
+        self.st_atime = st_atime
+        self.st_nlink = st_nlink
+        self.st_size = st_size
+        self.st_uid = st_uid
+        self.st_gid = st_gid
+        self.st_blksize = st_blksize
+
+    @property
+    def is_dir(self):
+        return bool(self.st_mode & S_IFDIR)
+
+    def to_dict(self, **overrides):
+        sd = dict(st_mode=self.st_mode,
+                  st_ctime=self.st_mtime,
+                  st_mtime=self.st_mtime,
+                  st_atime=self.st_atime,
+                  st_nlink=self.st_nlink,
+                  st_blocks=self.st_size // self.st_blksize,
+                  st_size=self.st_size,
+                  st_uid=self.st_uid,
+                  st_gid=self.st_gid,
+                  st_blksize=self.st_blksize)
+        sd.update(overrides)
+        return sd
+
+
+def webhdfs_entry_to_stat(s):
     mode = int(s['permission'], 8)
     if s['type'] == 'DIRECTORY':
         mode |= S_IFDIR
     else:
         mode |= S_IFREG
-    mtime = s['modificationTime'] / 1000
-    atime = s['accessTime'] / 1000
-    blksize = max(s['blockSize'], 1024*1024)
-    sd = dict(name=s['pathSuffix'],
-              st_mode=mode,
-              st_ctime=mtime,
-              st_mtime=mtime,
-              st_atime=atime,
-              st_nlink=s['childrenNum'] or 1,
-              st_blocks=s['length'] // blksize,
-              st_size=s['length'],
-              st_creator = s['owner'],
-              st_uid=owner_to_uid(s['owner']),
-              st_gid=group_to_gid(s['group']),
-              st_blksize=blksize)
-    return sd
+    return FileStat(st_mode=mode,
+                    st_mtime=s['modificationTime'] / 1000,
+                    st_atime=s['accessTime'] / 1000,
+                    st_nlink=s['childrenNum'] or 1,
+                    st_size=s['length'],
+                    st_uid=owner_to_uid(s['owner']),
+                    st_gid=group_to_gid(s['group']),
+                    st_blksize=max(s['blockSize'], 1024*1024))
+
+
+def webhdfs_entry_to_named_stat(s):
+    return s['pathSuffix'], webhdfs_entry_to_stat(s)
+
+
+def webhdfs_entry_to_dict(s):
+    return webhdfs_entry_to_stat(s).to_dict(name=s['pathSuffix'])
 
 if __name__ == '__main__':
     webhdfs = webhdfs_connect(configure())
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Bulk operations on HDFS over WebHDFS, without going through a FUSE mount:
+
+    webhdfs <server[:port]> ls [-R] <path>
+    webhdfs <server[:port]> du [-s] [-H] <path>...
+    webhdfs <server[:port]> get <hdfs path> <local path>
+    webhdfs <server[:port]> put <local path> <hdfs path>
+
+Directory trees are listed and copied by a pool of worker threads, large
+files are read with parallel ranged requests and written with streaming
+uploads, and copies keep the modification times and permissions.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import os
+import posixpath
+import stat
+import sys
+import threading
+import time
+
+from config.webhdfs import WebHDFSConfig, add_connection_arguments, base_url
+from pywebhdfs import errors
+import webhdfs
+
+DEFAULT_WORKERS = 8
+DEFAULT_PARALLEL_READS = 8
+DEFAULT_PART_SIZE = 16
+CHUNK_SIZE = 1024 * 1024
+# Directories are created with it before they are filled
+OWNER_RWX = stat.S_IRWXU
+CONNECTION_ARGUMENTS = ('hdfs_host', 'hdfs_port', 'hdfs_user_name', 'proxy_host', 'proxy_port')
+
+
+def commandline_parser():
+    parser = argparse.ArgumentParser(
+        prog='webhdfs', description='Bulk operations on HDFS over WebHDFS')
+    add_connection_arguments(parser)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, metavar='<threads>',
+                        help=f'Number of files and directories processed concurrently, '
+                             f'{DEFAULT_WORKERS} by default')
+    parser.add_argument('--parallel-reads', type=int, default=DEFAULT_PARALLEL_READS,
+                        metavar='<requests>',
+                        help=f'Number of concurrent ranged requests reading large files, '
+                             f'{DEFAULT_PARALLEL_READS} by default')
+    parser.add_argument('--part-size', type=int, default=DEFAULT_PART_SIZE, metavar='<MB>',
+                        help=f'Size of the ranges large files are read in, '
+                             f'{DEFAULT_PART_SIZE} MB by default')
+
+    commands = parser.add_subparsers(dest='command', metavar='<command>')
+    commands.required = True
+    ls = commands.add_parser('ls', help='List a directory')
+    ls.add_argument('-R', dest='recursive', action='store_true', help='List subdirectories recursively')
+    ls.add_argument('path')
+    du = commands.add_parser('du', help='Show the space used by directories, '
+                                        'computed by the namenode')
+    du.add_argument('-s', dest='summary', action='store_true',
+                    help='Show a total for every path instead of its entries')
+    du.add_argument('-H', dest='human', action='store_true', help='Show human readable sizes')
+    du.add_argument('paths', nargs='+')
+    get = commands.add_parser('get', help='Copy a file or directory tree from HDFS')
+    get.add_argument('source')
+    get.add_argument('destination')
+    put = commands.add_parser('put', help='Copy a file or directory tree to HDFS')
+    put.add_argument('source')
+    put.add_argument('destination')
+    return parser
+
+
+class Transfer(object):
+    """
+    Counts the files and bytes copied by the workers and the failures
+    """
+
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        self.failures = 0
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def done(self, size):
+        with self._lock:
+            self.files += 1
+            self.bytes += size
+
+    def failed(self, path, e):
+        print(f'{path}: {e}', file=sys.stderr)
+        with self._lock:
+            self.failures += 1
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        print('{} files, {:.1f} MB in {:.2f} s, {:.1f} MB/s{}'.format(
+            self.files, self.bytes / 1024 / 1024, elapsed,
+            self.bytes / 1024 / 1024 / elapsed if elapsed else 0,
+            f', {self.failures} failed' if self.failures else ''),
+            file=sys.stderr)
+
+
+class BulkClient(object):
+    def __init__(self, client, workers, parallel_reads, part_size):
+        self.client = client
+        self.parallel_reads = parallel_reads
+        self.part_size = part_size
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='webhdfs-worker')
+
+    def _list(self, path):
+        return self.client.list_dir(path)["FileStatuses"]["FileStatus"]
+
+    def _status(self, path):
+        return self.client.get_file_dir_status(path)["FileStatus"]
+
+    def ls(self, path, recursive):
+        """
+        Print the entries in the format of hdfs dfs -ls. Subdirectories are
+        listed by the pool ahead of being printed, depth first.
+        """
+        status = self._status(path)
+        if status['type'] != 'DIRECTORY':
+            print_entry(status, path)
+            return
+        self._print_listing(path, self.pool.submit(self._list, path), recursive)
+
+    def _print_listing(self, path, listing, recursive):
+        entries = listing.result()
+        subdirs = []
+        for entry in entries:
+            entry_path = posixpath.join(path, entry['pathSuffix'])
+            if recursive and entry['type'] == 'DIRECTORY':
+                subdirs.append((entry, entry_path, self.pool.submit(self._list, entry_path)))
+            else:
+                subdirs.append((entry, entry_path, None))
+        for entry, entry_path, sublisting in subdirs:
+            print_entry(entry, entry_path)
+            if sublisting is not None:
+                self._print_listing(entry_path, sublisting, recursive)
+
+    def du(self, paths, summary, human):
+        """
+        Print the length and consumed space of every path, or of every entry
+        of the paths, with one GETCONTENTSUMMARY call each
+        """
+        targets = []
+        for path in paths:
+            if summary or self._status(path)['type'] != 'DIRECTORY':
+                targets.append(path)
+            else:
+                targets.extend(posixpath.join(path, entry['pathSuffix'])
+                               for entry in self._list(path))
+        summaries = self.pool.map(
+            lambda target: self.client.get_content_summary(target)["ContentSummary"], targets)
+        for target, content_summary in zip(targets, summaries):
+            print('{:>12}  {:>12}  {}'.format(
+                format_size(content_summary['length'], human),
+                format_size(content_summary['spaceConsumed'], human), target))
+
+    def get(self, source, destination):
+        transfer = Transfer()
+        status = self._status(source)
+        if os.path.isdir(destination):
+            destination = os.path.join(destination, posixpath.basename(source.rstrip('/')))
+        if status['type'] == 'DIRECTORY':
+            self._get_tree(source, destination, status, transfer)
+        else:
+            self._get_file(source, destination, status, transfer)
+        transfer.report()
+        return transfer
+
+    def _get_tree(self, source, destination, status, transfer):
+        # Directories are listed by the pool as well, and the files of a
+        # directory are queued as soon as its listing arrives
+        dirs = [self.pool.submit(self._get_dir, source, destination, status, transfer)]
+        files = []
+        directories = []
+        while dirs:
+            listed = dirs.pop().result()
+            if listed is None:
+                continue
+            dir_source, dir_destination, dir_status, entries = listed
+            directories.append((dir_destination, dir_status))
+            for entry in entries:
+                entry_source = posixpath.join(dir_source, entry['pathSuffix'])
+                entry_destination = os.path.join(dir_destination, entry['pathSuffix'])
+                if entry['type'] == 'DIRECTORY':
+                    dirs.append(self.pool.submit(self._get_dir, entry_source,
+                                                 entry_destination, entry, transfer))
+                else:
+                    files.append(self.pool.submit(self._get_file, entry_source,
+                                                  entry_destination, entry, transfer))
+        for future in files:
+            future.result()
+        # Set last, as writing the files changes the times of the directories,
+        # and read-only directories can only be filled before their
+        # permissions are applied
+        for dir_destination, dir_status in directories:
+            set_local_times(dir_destination, dir_status)
+            os.chmod(dir_destination, int(dir_status['permission'], 8))
+
+    def _get_dir(self, source, destination, status, transfer):
+        try:
+            os.makedirs(destination, exist_ok=True)
+            os.chmod(destination, int(status['permission'], 8) | OWNER_RWX)
+            return source, destination, status, self._list(source)
+        except (errors.PyWebHdfsException, OSError) as e:
+            transfer.failed(source, e)
+
+    def _get_file(self, source, destination, status, transfer):
+        try:
+            size = status['length']
+            fd = os.open(destination, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                         int(status['permission'], 8))
+            try:
+                if size > self.part_size:
+                    self._read_parallel(source, fd, size)
+                else:
+                    for chunk in self.client.stream_file(source, CHUNK_SIZE):
+                        os.write(fd, chunk)
+            finally:
+                os.close(fd)
+            set_local_times(destination, status)
+            transfer.done(size)
+        except (errors.PyWebHdfsException, OSError) as e:
+            transfer.failed(source, e)
+
+    def _read_parallel(self, source, fd, size):
+        """
+        Read a large file with parallel_reads ranged requests at a time,
+        writing every range at its offset as it arrives
+        """
+        os.ftruncate(fd, size)
+        offsets = range(0, size, self.part_size)
+        for batch in range(0, len(offsets), self.parallel_reads):
+            parts = [(offset, bytearray(min(self.part_size, size - offset)))
+                     for offset in offsets[batch:batch + self.parallel_reads]]
+            received = self.client.read_file_parallel_into(source, parts, self.parallel_reads)
+            for (offset, buf), length in zip(parts, received):
+                if length < len(buf):
+                    raise IOError(f'File ended early at {offset + length}')
+                os.pwrite(fd, buf, offset)
+
+    def put(self, source, destination):
+        transfer = Transfer()
+        try:
+            if self._status(destination)['type'] == 'DIRECTORY':
+                destination = posixpath.join(destination, os.path.basename(source.rstrip('/')))
+        except errors.FileNotFound:
+            pass
+        if os.path.isdir(source):
+            self._put_tree(source, destination, transfer)
+        else:
+            self._put_file(source, destination, transfer)
+        transfer.report()
+        return transfer
+
+    def _put_tree(self, source, destination, transfer):
+        directories = []
+        files = []
+        for dirpath, _, filenames in os.walk(source):
+            relative = os.path.relpath(dirpath, source)
+            dir_destination = destination if relative == '.' else \
+                posixpath.join(destination, *relative.split(os.sep))
+            directories.append((dirpath, dir_destination))
+            files.extend((os.path.join(dirpath, name), posixpath.join(dir_destination, name))
+                         for name in filenames)
+        # MKDIRS creates the parents too, so the order doesn't matter
+        for future in [self.pool.submit(self._put_dir, dirpath, dir_destination, transfer)
+                       for dirpath, dir_destination in directories]:
+            future.result()
+        list(self.pool.map(lambda paths: self._put_file(*paths, transfer), files))
+        for future in [self.pool.submit(self._finish_dir, dirpath, dir_destination, transfer)
+                       for dirpath, dir_destination in directories]:
+            future.result()
+
+    def _put_dir(self, source, destination, transfer):
+        # Created writable, so that read-only directories can be filled,
+        # with their permissions applied by _finish_dir
+        try:
+            permission = int(local_permission(source), 8) | OWNER_RWX
+            self.client.make_dir(destination, permission=oct(permission)[2:])
+        except (errors.PyWebHdfsException, OSError) as e:
+            transfer.failed(source, e)
+
+    def _finish_dir(self, source, destination, transfer):
+        self._set_times(source, destination, transfer)
+        try:
+            self.client.set_permission(destination, local_permission(source))
+        except (errors.PyWebHdfsException, OSError) as e:
+            transfer.failed(source, e)
+
+    def _put_file(self, source, destination, transfer):
+        try:
+            with open(source, 'rb') as f:
+                self.client.stream_create_file(destination, f, CHUNK_SIZE, overwrite=True,
+                                               permission=local_permission(source))
+            self._set_times(source, destination, transfer)
+            transfer.done(os.path.getsize(source))
+        except (errors.PyWebHdfsException, OSError) as e:
+            transfer.failed(source, e)
+
+    def _set_times(self, source, destination, transfer):
+        try:
+            st = os.stat(source)
+            self.client.set_times(destination, modification_time=st.st_mtime * 1000,
+                                  access_time=st.st_atime * 1000)
+        except (errors.PyWebHdfsException, OSError) as e:
+            transfer.failed(source, e)
+
+
+def print_entry(entry, path):
+    is_dir = entry['type'] == 'DIRECTORY'
+    mode = stat.filemode(int(entry['permission'], 8) | (stat.S_IFDIR if is_dir else stat.S_IFREG))
+    mtime = datetime.datetime.fromtimestamp(entry['modificationTime'] / 1000)
+    print('{} {:>3} {:8} {:10} {:>12} {} {}'.format(
+        mode, entry['replication'] or '-', entry['owner'], entry['group'], entry['length'],
+        mtime.strftime('%Y-%m-%d %H:%M'), path))
+
+
+def format_size(size, human):
+    if not human:
+        return str(size)
+    for unit in ('', 'K', 'M', 'G', 'T'):
+        if size < 1024:
+            break
+        size /= 1024
+    else:
+        unit = 'P'
+    return f'{size:.1f}{unit}' if unit else str(size)
+
+
+def local_permission(path):
+    return oct(stat.S_IMODE(os.stat(path).st_mode))[2:]
+
+
+def set_local_times(path, status):
+    os.utime(path, (status['accessTime'] / 1000 or status['modificationTime'] / 1000,
+                    status['modificationTime'] / 1000))
+
+
+def main(argv=None):
+    args = commandline_parser().parse_args(argv)
+    connection = {name: getattr(args, name) for name in CONNECTION_ARGUMENTS
+                  if hasattr(args, name)}
+    config = WebHDFSConfig(hdfs_baseurl=base_url(args.hdfs_host, args.hdfs_port), **connection)
+    client = webhdfs.webhdfs_connect(config)
+    bulk = BulkClient(client, workers=args.workers, parallel_reads=args.parallel_reads,
+                      part_size=args.part_size * 1024 * 1024)
+    try:
+        if args.command == 'ls':
+            bulk.ls(args.path, args.recursive)
+        elif args.command == 'du':
+            bulk.du(args.paths, args.summary, args.human)
+        else:
+            transfer = getattr(bulk, args.command)(args.source, args.destination)
+            if transfer.failures:
+                return 1
+    except errors.PyWebHdfsException as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        bulk.pool.shutdown()
+        client.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())